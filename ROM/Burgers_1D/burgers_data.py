@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+"""
+Snapshot generation for the parametric 1D Burgers problem
+
+uexact is written with NumPy ufuncs, so the whole (x, t, nu) snapshot tensor
+is evaluated with a single broadcast call instead of one scalar call per
+grid point. With chunk set, the x direction is processed in blocks of chunk
+points to bound the memory of the broadcast temporaries.
+
+"""
+import numpy as np
+
+def uexact(x, t, nu):  #Exact Solution [Sirisup]
+    t0 = np.exp(1.0/(8.0*nu))
+    uexact = (x/(t+1.0))/(1.0+np.sqrt((t+1.0)/t0)*np.exp(x*x/(4.0*nu*(t+1.0))))
+    return uexact
+
+def exact_snapshots(x, t, nu, chunk=None, out=None):
+    # returns u[i,n,p] = uexact(x[i],t[n],nu[p]), shape (len(x), len(t), len(nu))
+    x = np.asarray(x, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)
+    nu = np.atleast_1d(np.asarray(nu, dtype=np.float64))
+
+    if out is None:
+        out = np.empty((x.size, t.size, nu.size))
+
+    if chunk is None:
+        chunk = x.size
+
+    tt = t[np.newaxis,:,np.newaxis]
+    nn = nu[np.newaxis,np.newaxis,:]
+    for i in range(0, x.size, chunk):
+        xx = x[i:i+chunk,np.newaxis,np.newaxis]
+        out[i:i+chunk,:,:] = uexact(xx, tt, nn)
+
+    return out
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Galerkin operators of the 1D Burgers equation u_t = nu*u_xx - u*u_x
+
+    b_l[i,k]    =  nu * <PHIdd[:,i], PHI[:,k]>
+    b_nl[i,j,k] = -<PHI[:,i]*PHId[:,j], PHI[:,k]>
+
+Each operator is assembled by one matrix product over the grid: the
+(nx+1, nr*nr) table of products PHI[:,i]*PHId[:,j] is formed once and
+projected on all modes with PHI^T, instead of nr^3 dot products.
+
+get_operators returns the operators of a basis from a cache keyed by a hash
+of the basis values and the grid spacing, so the standard GP, modified GP
+and test stages assemble each basis only once. With cache_dir set, the
+operators are also stored as .npz files and reused by later runs.
+
+"""
+import os
+import numpy as np
+from compact import pade4d, pade4dd
+from cache_io import atomic_savez, array_key
+
+def linear_operator(PHI, PHIdd, nu):
+    b_l = nu*np.dot(PHIdd.T, PHI)
+    return b_l
+
+def nonlinear_operator(PHI, PHId):
+    n, nr = PHI.shape
+    temp = np.reshape(PHI[:,:,np.newaxis]*PHId[:,np.newaxis,:], (n, nr*nr))
+    b_nl = - np.reshape(np.dot(temp.T, PHI), (nr, nr, nr))
+    return b_nl
+
+class GalerkinOperators:
+    '''
+    operators on a fixed basis, split in parameter independent pieces:
+    b_l(nu) = nu*<PHIdd, PHI> is affine in nu and b_nl does not depend on
+    nu, so a new viscosity costs a scalar multiply instead of an assembly;
+    b_l(nu) with an array nu returns the stacked (len(nu), nr, nr) operators
+    (e.g. for ab3_batch)
+
+    '''
+    def __init__(self, PHI=None, PHId=None, PHIdd=None):
+        if PHI is not None:
+            self.l0 = linear_operator(PHI, PHIdd, 1.0)
+            self.b_nl = nonlinear_operator(PHI, PHId)
+
+    def b_l(self, nu):
+        return np.multiply.outer(nu, self.l0)
+
+    def save(self, filename):
+        atomic_savez(filename, l0=self.l0, b_nl=self.b_nl)
+
+    @classmethod
+    def load(cls, filename):
+        ops = cls()
+        with np.load(filename) as data:
+            ops.l0 = data['l0']
+            ops.b_nl = data['b_nl']
+        return ops
+
+# derivatives of all modes (columns of PHI) at once, fourth-order compact scheme
+def basis_derivatives(PHI, dx):
+    nx = PHI.shape[0] - 1
+    PHId = pade4d(PHI, dx, nx)
+    PHIdd = pade4dd(PHI, dx, nx)
+    return PHId, PHIdd
+
+#%%
+# operator cache
+_operators = {}
+
+def operator_key(PHI, dx):
+    return array_key([PHI], float(dx))
+
+def get_operators(PHI, dx, cache_dir=None):
+    key = operator_key(PHI, dx)
+    if key in _operators:
+        return _operators[key]
+
+    filename = None
+    if cache_dir is not None:
+        filename = os.path.join(cache_dir, "ops_"+key+".npz")
+
+    if filename is not None and os.path.exists(filename):
+        ops = GalerkinOperators.load(filename)
+    else:
+        PHId, PHIdd = basis_derivatives(PHI, dx)
+        ops = GalerkinOperators(PHI, PHId, PHIdd)
+        if filename is not None:
+            ops.save(filename)
+
+    _operators[key] = ops
+    return ops
@@ -8,6 +8,15 @@ Created on Mon Oct  7 17:41:10 2019
 import numpy as np
 import matplotlib.pyplot as plt
 from numpy import linalg as LA
+import os
+import sys
+# shared ROM routines, found from any working directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from galerkin import rhs, ab3_batch
+from pod import POD, PODproj, PODrec
+from grassmann import MultiChartGrassmann
+from burgers_data import exact_snapshots
+from burgers_galerkin import get_operators
 from scipy.integrate import simps
 
 from numpy.random import seed
@@ -16,7 +25,6 @@ from tensorflow import set_random_seed
 set_random_seed(2)
 import pandas as pd
 import time as clck
-import os
 
 from keras.models import Sequential
 from keras.layers import Dense
@@ -42,69 +50,6 @@ mpl.rcParams['text.latex.preamble'] = [r'\usepackage{amsmath}']
 
 #%% Define Functions
 
-###############################################################################
-#POD Routines
-###############################################################################         
-def POD(u,R): #Basis Construction
-    n,ns = u.shape
-    U,S,Vh = LA.svd(u, full_matrices=False)
-    Phi = U[:,:R]     
-    L = S**2
-    #compute RIC (relative inportance index)
-    RIC = sum(L[:R])/sum(L)*100   
-    return Phi,L,RIC
-
-def PODproj(u,Phi): #Projection
-    a = np.dot(u.T,Phi)  # u = Phi * a.T
-    return a
-
-def PODrec(a,Phi): #Reconstruction    
-    u = np.dot(Phi,a.T)    
-    return u
-
-
-###############################################################################
-#Interpolation Routines
-###############################################################################  
-# Grassmann Interpolation
-def GrassInt(Phi,pref,p,pTest):
-    # Phi is input basis [training]
-    # pref is the reference basis [arbitrarty] for Grassmann interpolation
-    # p is the set of training parameters
-    # pTest is the testing parameter
-    
-    nx,nr,nc = Phi.shape
-    Phi0 = Phi[:,:,pref] 
-    Phi0H = Phi0.T 
-
-    print('Calculating Gammas...')
-    Gamma = np.zeros((nx,nr,nc))
-    for i in range(nc):
-        templ = ( np.identity(nx) - Phi0.dot(Phi0H) )
-        tempr = LA.inv( Phi0H.dot(Phi[:,:,i]) )
-        temp = LA.multi_dot([templ,Phi[:,:,i],tempr])
-               
-        U, S, Vh = LA.svd(temp, full_matrices=False)
-        S = np.diag(S)
-        Gamma[:,:,i] = LA.multi_dot([U,np.arctan(S),Vh])
-    
-    print('Interpolating ...')
-    alpha = np.ones(nc)
-    GammaL = np.zeros((nx,nr))
-    #% Lagrange Interpolation
-    for i in range(nc):
-        for j in range(nc):
-            if (j != i) :
-                alpha[i] = alpha[i]*(pTest-p[j])/(p[i]-p[j])
-    for i in range(nc):
-        GammaL = GammaL + alpha[i] * Gamma[:,:,i]
-            
-    U, S, Vh = LA.svd(GammaL, full_matrices=False)
-    PhiL = LA.multi_dot([ Phi0 , Vh.T ,np.diag(np.cos(S)) ]) + \
-           LA.multi_dot([ U , np.diag(np.sin(S)) ])
-    PhiL = PhiL.dot(Vh)
-    return PhiL
-
 ###############################################################################
 #LSTM Routines
 ############################################################################### 
@@ -119,84 +64,6 @@ def create_training_data_lstm(training_set, m, n, lookback):
         xtrain[i,:,:] = a
     return xtrain , ytrain
 
-###############################################################################
-# Burgers Routines
-###############################################################################
-def uexact(x, t, nu):  #Exact Solution [Sirisup]
-    t0 = np.exp(1.0/(8.0*nu))
-    uexact = (x/(t+1.0))/(1.0+np.sqrt((t+1.0)/t0)*np.exp(x*x/(4.0*nu*(t+1.0))))
-    return uexact
-
-def rhs(nr, b_l, b_nl, a): # Right Handside of Galerkin Projection
-    r2, r3, r = [np.zeros(nr) for _ in range(3)]
-    
-    for k in range(nr):
-        r2[k] = 0.0
-        for i in range(nr):
-            r2[k] = r2[k] + b_l[i,k]*a[i]
-    
-    for k in range(nr):
-        r3[k] = 0.0
-        for j in range(nr):
-            for i in range(nr):
-                r3[k] = r3[k] + b_nl[i,j,k]*a[i]*a[j]
-    
-    r = r2 + r3    
-    return r
-
-###############################################################################
-# Numerical Routines
-###############################################################################
-# Thomas algorithm for solving tridiagonal systems:    
-def tdma(a, b, c, r, up, s, e):
-    for i in range(s+1,e+1):
-        b[i] = b[i] - a[i]/b[i-1]*c[i-1]
-        r[i] = r[i] - a[i]/b[i-1]*r[i-1]   
-    up[e] = r[e]/b[e]   
-    for i in range(e-1,s-1,-1):
-        up[i] = (r[i]-c[i]*up[i+1])/b[i]
-
-# Computing first derivatives using the fourth order compact scheme:  
-def pade4d(u, h, n):
-    a, b, c, r = [np.zeros(n+1) for _ in range(4)]
-    ud = np.zeros(n+1)
-    i = 0
-    b[i] = 1.0
-    c[i] = 2.0
-    r[i] = (-5.0*u[i] + 4.0*u[i+1] + u[i+2])/(2.0*h)
-    for i in range(1,n):
-        a[i] = 1.0
-        b[i] = 4.0
-        c[i] = 1.0
-        r[i] = 3.0*(u[i+1] - u[i-1])/h
-    i = n
-    a[i] = 2.0
-    b[i] = 1.0
-    r[i] = (-5.0*u[i] + 4.0*u[i-1] + u[i-2])/(-2.0*h)
-    tdma(a, b, c, r, ud, 0, n)
-    return ud
-    
-# Computing second derivatives using the foruth order compact scheme:  
-def pade4dd(u, h, n):
-    a, b, c, r = [np.zeros(n+1) for _ in range(4)]
-    udd = np.zeros(n+1)
-    i = 0
-    b[i] = 1.0
-    c[i] = 11.0
-    r[i] = (13.0*u[i] - 27.0*u[i+1] + 15.0*u[i+2] - u[i+3])/(h*h)
-    for i in range(1,n):
-        a[i] = 0.1
-        b[i] = 1.0
-        c[i] = 0.1
-        r[i] = 1.2*(u[i+1] - 2.0*u[i] + u[i-1])/(h*h)
-    i = n
-    a[i] = 11.0
-    b[i] = 1.0
-    r[i] = (13.0*u[i] - 27.0*u[i-1] + 15.0*u[i-2] - u[i-3])/(h*h)
-    
-    tdma(a, b, c, r, udd, 0, n)
-    return udd
-
 def plot_3d_surface(x,t,field):
     
     fig = plt.figure(figsize=(8,6))
@@ -233,30 +100,26 @@ tm = 1.5
 dt = tm/ns
 
 noise = 0.3
+pod_method = 'svd' # POD backend: 'svd', 'snapshots' or 'randomized' (pod.py)
+
+ops_folder = "./operators" # Galerkin operator cache
 
 ReTest = 500
 
 #%% Data generation for training
-x = np.linspace(0, lx, nx+1)
-t = np.linspace(0, tm, ns+1)
 um = np.zeros((nx+1, ns+1, nc))
 up = np.zeros((nx+1, ns+1, nc))
 up1 = np.zeros((nx+1, ns+1, nc))
 uo = np.zeros((nx+1, ns+1, nc))
 
-for p in range(0,nc):
-    for n in range(0,ns+1):
-        t[n] = dt*n
-        for i in range(nx+1):
-            x[i]=dx*i
-            um[i,n,p]=uexact(x[i],t[n],nu[p]) #snapshots from unperturbed solution
-            #up[i,n,p]=0.1*um[i,n,p] #perturbation (unknown physics)
-            up[i,n,p]=noise*um[i,n,p]
-            #up[i,n,p]=0.1*np.sin(np.pi*x[i])*np.exp(nu[p]*t[n])/(2+np.cos(np.pi*x[i])*np.exp(nu[p]*t[n]))
-            #up[i,n,p]= 0.1*(np.sin(np.pi*x[i]))*t[n]**2*x[i]
-            #up[i,n,p]= 0.1*(np.sin(np.pi*x[i]))*np.exp(x[i]**2*t[n])
-            uo[i,n,p]=um[i,n,p]+up[i,n,p] #snapshots from observed solution
-            #uo[i,n,p]=uexact(x[i],t[n],1.2*nu[p]) # perturbation by using different parameter
+x = dx*np.arange(nx+1)
+t = dt*np.arange(ns+1)
+
+exact_snapshots(x, t, nu, out=um) #snapshots from unperturbed solution
+#up = 0.1*um #perturbation (unknown physics)
+up[:,:,:] = noise*um
+uo[:,:,:] = um + up #snapshots from observed solution
+#uo = exact_snapshots(x, t, 1.2*nu) # perturbation by using different parameter
 
 #plot_3d_surface(x,t,uo[:,:,-1])
 
@@ -269,7 +132,7 @@ RIC = np.zeros((nc))    #Relative information content
 print('Computing POD basis...')
 for p in range(0,nc):
     u = uo[:,:,p]
-    PHI[:,:,p], L[:,p], RIC[p]  = POD(u, nr) 
+    PHI[:,:,p], L[:,p], RIC[p]  = POD(u, nr, pod_method) 
 
 #%% Calculating true POD coefficients (observed)
 at = np.zeros((ns+1,nr,nc))
@@ -284,79 +147,29 @@ for p in range(nc):
 ###############################
 b_l = np.zeros((nr,nr,nc))
 b_nl = np.zeros((nr,nr,nr,nc))
-PHId = np.zeros((nx+1,nr,nc))
-PHIdd = np.zeros((nx+1,nr,nc))
 
+# linear and nonlinear terms, assembled once per basis (operator cache,
+# also stored in ./operators for later runs)
 for p in range(nc):
-    for i in range(nr):
-        PHIdd[:,i,p] = pade4dd(PHI[:,i,p],dx,nx)
-        PHId[:,i,p] = pade4d(PHI[:,i,p],dx,nx)
-
-# linear term   
-for p in range(nc):
-    for k in range(nr):
-        for i in range(nr):
-            b_l[i,k,p] = nu[p]*np.dot(PHIdd[:,i,p].T , PHI[:,k,p]) 
-                   
-# nonlinear term 
-for p in range(nc):
-    for k in range(nr):
-        for j in range(nr):
-            for i in range(nr):
-                temp = PHI[:,i,p]*PHId[:,j,p]
-                b_nl[i,j,k,p] = - np.dot( temp.T, PHI[:,k,p] ) 
+    ops = get_operators(PHI[:,:,p], dx, cache_dir=ops_folder)
+    b_l[:,:,p] = ops.b_l(nu[p])
+    b_nl[:,:,:,p] = ops.b_nl
 
 # solving ROM by Adams-Bashforth scheme          
-aGP = np.zeros((ns+1,nr,nc))
-for p in range(nc):
-    aGP[0,:,p] = at[0,:nr,p]
-    aGP[1,:,p] = at[1,:nr,p]
-    aGP[2,:,p] = at[2,:nr,p]
-    for k in range(3,ns+1):
-        r1 = rhs(nr, b_l[:,:,p], b_nl[:,:,:,p], aGP[k-1,:,p])
-        r2 = rhs(nr, b_l[:,:,p], b_nl[:,:,:,p], aGP[k-2,:,p])
-        r3 = rhs(nr, b_l[:,:,p], b_nl[:,:,:,p], aGP[k-3,:,p])
-        temp= (23/12) * r1 - (16/12) * r2 + (5/12) * r3
-        aGP[k,:,p] = aGP[k-1,:,p] + dt*temp 
+# all parameters are integrated at once, parameter index first
+aGP = ab3_batch(np.moveaxis(b_l,-1,0), np.moveaxis(b_nl,-1,0),
+                np.moveaxis(at[:3,:nr,:],-1,0), dt, ns)
+aGP = np.moveaxis(aGP,0,-1) # (ns+1,nr,nc)
 
 #%% modified Galerkin-projection
-b_l = np.zeros((nr,nr,nc))
-b_nl = np.zeros((nr,nr,nr,nc))
-PHId = np.zeros((nx+1,nr,nc))
-PHIdd = np.zeros((nx+1,nr,nc))
-
-for p in range(nc):
-    for i in range(nr):
-        PHIdd[:,i,p] = pade4dd(PHI[:,i,p],dx,nx)
-        PHId[:,i,p] = pade4d(PHI[:,i,p],dx,nx)
-
-# linear term   
-for p in range(nc):
-    for k in range(nr):
-        for i in range(nr):
-            b_l[i,k,p] = nu[p]*np.dot(PHIdd[:,i,p].T , PHI[:,k,p]) 
-                   
-# nonlinear term 
-for p in range(nc):
-    for k in range(nr):
-        for j in range(nr):
-            for i in range(nr):
-                temp = PHI[:,i,p]*PHId[:,j,p]
-                b_nl[i,j,k,p] = - np.dot( temp.T, PHI[:,k,p] ) 
+# same bases and operators (b_l, b_nl) as the standard GP above
 
 # solving ROM by Adams-Bashforth scheme          
-aGPm = np.zeros((ns+1,nr,nc))
-for p in range(nc):
-    aGPm[0,:,p] = at[0,:nr,p]
-    aGPm[1,:,p] = at[1,:nr,p]
-    aGPm[2,:,p] = at[2,:nr,p]
-    for k in range(3,ns+1):
-        r1 = rhs(nr, b_l[:,:,p], b_nl[:,:,:,p], at[k-1,:,p])
-        r2 = rhs(nr, b_l[:,:,p], b_nl[:,:,:,p], at[k-2,:,p])
-        r3 = rhs(nr, b_l[:,:,p], b_nl[:,:,:,p], at[k-3,:,p])
-        temp= (23/12) * r1 - (16/12) * r2 + (5/12) * r3
-        
-        aGPm[k,:,p] = at[k-1,:,p] + dt*temp 
+# rhs evaluated on the true coefficients, all parameters at once
+atrue = np.moveaxis(at[:,:nr,:],-1,0)
+aGPm = ab3_batch(np.moveaxis(b_l,-1,0), np.moveaxis(b_nl,-1,0),
+                 atrue[:,:3,:], dt, ns, atrue=atrue)
+aGPm = np.moveaxis(aGPm,0,-1) # (ns+1,nr,nc)
 
 #%%
 def plot_data(t,at,aGP,atm):
@@ -491,25 +304,22 @@ model.save(filename)
 
 #%% Testing
 # Data generation for testing
-x = np.linspace(0, lx, nx+1)
-t = np.linspace(0, tm, ns+1)
 uTest = np.zeros((nx+1, ns+1))
 upTest = np.zeros((nx+1, ns+1))
 uoTest = np.zeros((nx+1, ns+1))
 nuTest = 1/ReTest
-for n in range(ns+1):
-   t[n] = dt*n
-   for i in range(nx+1):
-       x[i]=dx*i
-       uTest[i,n]=uexact(x[i],t[n],nuTest) #snapshots from exact solution
-       upTest[i,n]=noise*uTest[i,n]
-       uoTest[i,n] = uTest[i,n] + upTest[i,n]
+x = dx*np.arange(nx+1)
+t = dt*np.arange(ns+1)
+
+uTest[:,:] = exact_snapshots(x, t, nuTest)[:,:,0] #snapshots from exact solution
+upTest[:,:] = noise*uTest
+uoTest[:,:] = uTest + upTest
 
 nr = 24
 
 #% POD basis computation     
 print('Computing testing POD basis...')
-PHItrue, Ltrue, RICtrue  = POD(uoTest, nr) 
+PHItrue, Ltrue, RICtrue  = POD(uoTest, nr, pod_method) 
         
 #% Calculating true POD coefficients
 print('Computing testing POD coefficients...')
@@ -521,34 +331,23 @@ u_true = PODrec(aTrue,PHItrue)
 u_fom = uoTest
 
 #%% Basis Interpolation
-pref = 2 #Reference case in [0:nRe]
-PHItest = GrassInt(PHI,pref,nu,nuTest)
+# the reference basis is the training case nearest to the test parameter,
+# on a local chart; further test parameters only need grass.query
+grass = MultiChartGrassmann(PHI,nu)
+pref = grass.reference(nuTest) #Reference case in [0:nRe]
+print('Reference case for Grassmann interpolation: ', pref)
+PHItest = grass.query(nuTest)
 aTest = PODproj(uoTest,PHItest)
 
 print('Reconstructing with true coefficients for test Re')
 u_test = PODrec(aTest,PHItest)
 
 #%%
-b_l = np.zeros((nr,nr))
-b_nl = np.zeros((nr,nr,nr))
-PHId = np.zeros((nx+1,nr))
-PHIdd = np.zeros((nx+1,nr))
-
-for i in range(nr):
-    PHIdd[:,i] = pade4dd(PHItest[:,i],dx,nx)
-    PHId[:,i] = pade4d(PHItest[:,i],dx,nx)
-
-# linear term   
-for k in range(nr):
-    for i in range(nr):
-        b_l[i,k] = nuTest*np.dot(PHIdd[:,i].T , PHItest[:,k]) 
-                   
-# nonlinear term 
-for k in range(nr):
-    for j in range(nr):
-        for i in range(nr):
-            temp = PHItest[:,i]*PHId[:,j]
-            b_nl[i,j,k] = - np.dot( temp.T, PHItest[:,k] ) 
+# linear and nonlinear terms, assembled once for the interpolated basis;
+# another test viscosity only needs ops.b_l(nu)
+ops = get_operators(PHItest, dx, cache_dir=ops_folder)
+b_l = ops.b_l(nuTest)
+b_nl = ops.b_nl
 
 # solving ROM by Adams-Bashforth scheme          
 aGPtest = np.zeros((ns+1,nr))
@@ -673,8 +472,8 @@ def plot_data_allmodes(t,at,aTest,filename):
     
     for i in range(nrs):
         #for k in range(at.shape[2]):
-        ax[i].plot(t,at[:,i],label=str(k))
-        ax[i].plot(t,aTest[:,i],'k--',label=str(k))
+        ax[i].plot(t,at[:,i],label=str(i))
+        ax[i].plot(t,aTest[:,i],'k--',label=str(i))
         #ax[i].legend(loc=0)
         #ax[i].plot(t,aGP[:,i],label=r'Exact Values')
         #ax[i].plot(t,aGPm[:,i],'r-.',label=r'True Values')
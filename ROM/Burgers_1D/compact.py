@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Fourth-order compact (Pade) derivatives on a non-periodic uniform grid of
+n+1 points, with one-sided compact closures at the boundaries
+
+The derivative is u' = A^{-1} B u with a fixed tridiagonal A and an explicit
+stencil B, so for a given grid (n, h) it is a fixed linear operator.
+get_derivative returns it from a cache keyed by (n, h): A is factorised once
+(LAPACK gttrf) and every call is one multi-right-hand-side solve (gttrs) for
+u of shape (n+1,) or (n+1, m), e.g. all POD modes of a basis or a whole
+snapshot matrix. With dense=True the explicit (n+1, n+1) matrix D = A^{-1} B
+is formed instead and every call is one matrix product (small n only).
+
+"""
+import numpy as np
+from scipy.linalg.lapack import dgttrf, dgttrs
+
+#%%
+# tridiagonal coefficients: a sub-diagonal (a[0] unused), b diagonal,
+# c super-diagonal (c[n] unused)
+
+# Computing first derivatives using the fourth order compact scheme:
+def pade4d_coeffs(n):
+    a, b, c = [np.zeros(n+1) for _ in range(3)]
+    b[0] = 1.0
+    c[0] = 2.0
+    a[1:n] = 1.0
+    b[1:n] = 4.0
+    c[1:n] = 1.0
+    a[n] = 2.0
+    b[n] = 1.0
+    return a, b, c
+
+def pade4d_rhs(u, h, n):
+    r = np.zeros(u.shape)
+    r[0] = (-5.0*u[0] + 4.0*u[1] + u[2])/(2.0*h)
+    r[1:n] = 3.0*(u[2:n+1] - u[0:n-1])/h
+    r[n] = (-5.0*u[n] + 4.0*u[n-1] + u[n-2])/(-2.0*h)
+    return r
+
+# Computing second derivatives using the foruth order compact scheme:
+def pade4dd_coeffs(n):
+    a, b, c = [np.zeros(n+1) for _ in range(3)]
+    b[0] = 1.0
+    c[0] = 11.0
+    a[1:n] = 0.1
+    b[1:n] = 1.0
+    c[1:n] = 0.1
+    a[n] = 11.0
+    b[n] = 1.0
+    return a, b, c
+
+def pade4dd_rhs(u, h, n):
+    r = np.zeros(u.shape)
+    r[0] = (13.0*u[0] - 27.0*u[1] + 15.0*u[2] - u[3])/(h*h)
+    r[1:n] = 1.2*(u[2:n+1] - 2.0*u[1:n] + u[0:n-1])/(h*h)
+    r[n] = (13.0*u[n] - 27.0*u[n-1] + 15.0*u[n-2] - u[n-3])/(h*h)
+    return r
+
+_schemes = {1: (pade4d_coeffs, pade4d_rhs),
+            2: (pade4dd_coeffs, pade4dd_rhs)}
+
+#%%
+class CompactDerivative:
+    '''
+    derivative of the given order (1 or 2) on the grid (n, h); d(u) returns
+    the derivative of u (n+1,) or (n+1, m) along the first axis
+
+    '''
+    def __init__(self, n, h, order=1, dense=False):
+        self.n = n
+        self.h = h
+        coeffs, self.rhs = _schemes[order]
+
+        a, b, c = coeffs(n)
+        dl, d, du, du2, ipiv, info = dgttrf(a[1:], b, c[:-1])
+        if info != 0:
+            raise ValueError("singular compact scheme matrix, info = "+str(info))
+        self.lu = (dl, d, du, du2, ipiv)
+
+        self.D = None
+        if dense:
+            self.D = self.solve(self.rhs(np.eye(n+1), h, n))
+
+    def solve(self, r):
+        x, info = dgttrs(*self.lu, r)
+        return x
+
+    def __call__(self, u):
+        if self.D is not None:
+            return np.dot(self.D, u)
+        return self.solve(self.rhs(u, self.h, self.n))
+
+    def matrix(self):
+        if self.D is None:
+            return self.solve(self.rhs(np.eye(self.n+1), self.h, self.n))
+        return self.D
+
+_derivatives = {}
+
+def get_derivative(n, h, order=1, dense=False):
+    key = (int(n), float(h), order, dense)
+    if key not in _derivatives:
+        _derivatives[key] = CompactDerivative(n, h, order, dense)
+    return _derivatives[key]
+
+#%%
+def pade4d(u, h, n):
+    ud = get_derivative(n, h, 1)(u)
+    return ud
+
+def pade4dd(u, h, n):
+    udd = get_derivative(n, h, 2)(u)
+    return udd
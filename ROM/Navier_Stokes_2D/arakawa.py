@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fused Arakawa Jacobian + Laplacian kernel
+
+f = -J(w,s) + cl*lap(w) is computed in a single stencil sweep over the
+computational points (1:nx+2,1:ny+2) of the (nx+3, ny+3) arrays w, s (ghost
+points included). Rows are distributed over all cores (numba prange); the
+number of threads is controlled by NUMBA_NUM_THREADS.
+
+If numba is not installed, arakawa_rhs falls back to the NumPy slice version
+with the same signature (HAVE_NUMBA tells which one is used).
+
+arakawa_jacobian evaluates the Jacobian alone for stacks of fields with
+broadcasting; arakawa_jacobian_pairs gives J(w[i],s[j]) for all pairs of two
+stacks (compiled, or the broadcast NumPy version without numba), which is
+used to assemble the Galerkin tensors of all mode pairs at once
+(ns2d_galerkin.py).
+
+"""
+import numpy as np
+
+try:
+    import numba
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+#%%
+# NumPy version of the fused kernel
+def arakawa_rhs_numpy(w, s, f, dx, dy, cl):
+    nx = w.shape[0] - 3
+    ny = w.shape[1] - 3
+
+    aa = cl/(dx*dx)
+    bb = cl/(dy*dy)
+    gg = 1.0/(4.0*dx*dy)
+    hh = 1.0/3.0
+
+    #Arakawa
+    j1 = gg*( (w[2:nx+3,1:ny+2]-w[0:nx+1,1:ny+2])*(s[1:nx+2,2:ny+3]-s[1:nx+2,0:ny+1]) \
+             -(w[1:nx+2,2:ny+3]-w[1:nx+2,0:ny+1])*(s[2:nx+3,1:ny+2]-s[0:nx+1,1:ny+2]))
+
+    j2 = gg*( w[2:nx+3,1:ny+2]*(s[2:nx+3,2:ny+3]-s[2:nx+3,0:ny+1]) \
+            - w[0:nx+1,1:ny+2]*(s[0:nx+1,2:ny+3]-s[0:nx+1,0:ny+1]) \
+            - w[1:nx+2,2:ny+3]*(s[2:nx+3,2:ny+3]-s[0:nx+1,2:ny+3]) \
+            + w[1:nx+2,0:ny+1]*(s[2:nx+3,0:ny+1]-s[0:nx+1,0:ny+1]))
+
+    j3 = gg*( w[2:nx+3,2:ny+3]*(s[1:nx+2,2:ny+3]-s[2:nx+3,1:ny+2]) \
+            - w[0:nx+1,0:ny+1]*(s[0:nx+1,1:ny+2]-s[1:nx+2,0:ny+1]) \
+            - w[0:nx+1,2:ny+3]*(s[1:nx+2,2:ny+3]-s[0:nx+1,1:ny+2]) \
+            + w[2:nx+3,0:ny+1]*(s[2:nx+3,1:ny+2]-s[1:nx+2,0:ny+1]) )
+
+    jac = (j1+j2+j3)*hh
+
+    lap = aa*(w[2:nx+3,1:ny+2]-2.0*w[1:nx+2,1:ny+2]+w[0:nx+1,1:ny+2]) \
+        + bb*(w[1:nx+2,2:ny+3]-2.0*w[1:nx+2,1:ny+2]+w[1:nx+2,0:ny+1])
+
+    f[1:nx+2,1:ny+2] = -jac + lap
+
+    return f
+
+#%%
+# Arakawa Jacobian J(w,s) at the points (1:nx+2,1:ny+2) for stacks of fields:
+# w, s are (..., nx+3, ny+3) with ghost points, the leading axes broadcast
+# (e.g. w[:,None] and s[None,:] give all pairs of modes in one pass)
+def arakawa_jacobian(w, s, dx, dy):
+    nx = w.shape[-2] - 3
+    ny = w.shape[-1] - 3
+
+    gg = 1.0/(4.0*dx*dy)
+    hh = 1.0/3.0
+
+    im, ic, ip = slice(0,nx+1), slice(1,nx+2), slice(2,nx+3)
+    jm, jc, jp = slice(0,ny+1), slice(1,ny+2), slice(2,ny+3)
+
+    j1 = (w[...,ip,jc]-w[...,im,jc])*(s[...,ic,jp]-s[...,ic,jm]) \
+       - (w[...,ic,jp]-w[...,ic,jm])*(s[...,ip,jc]-s[...,im,jc])
+
+    j2 = w[...,ip,jc]*(s[...,ip,jp]-s[...,ip,jm]) \
+       - w[...,im,jc]*(s[...,im,jp]-s[...,im,jm]) \
+       - w[...,ic,jp]*(s[...,ip,jp]-s[...,im,jp]) \
+       + w[...,ic,jm]*(s[...,ip,jm]-s[...,im,jm])
+
+    j3 = w[...,ip,jp]*(s[...,ic,jp]-s[...,ip,jc]) \
+       - w[...,im,jm]*(s[...,im,jc]-s[...,ic,jm]) \
+       - w[...,im,jp]*(s[...,ic,jp]-s[...,im,jc]) \
+       + w[...,ip,jm]*(s[...,ip,jc]-s[...,ic,jm])
+
+    jac = (j1+j2+j3)*(gg*hh)
+    return jac
+
+# J(w[i],s[j]) for all pairs of the stacks w (nw, nx+3, ny+3), s (ns, nx+3, ny+3)
+# returns (nw, ns, nx+1, ny+1)
+def arakawa_jacobian_pairs_numpy(w, s, dx, dy):
+    return arakawa_jacobian(w[:,np.newaxis], s[np.newaxis,:], dx, dy)
+
+#%%
+# compiled version: one pass over memory, rows in parallel
+if HAVE_NUMBA:
+    @numba.njit(parallel=True, cache=True)
+    def arakawa_rhs(w, s, f, dx, dy, cl):
+        nx = w.shape[0] - 3
+        ny = w.shape[1] - 3
+
+        aa = cl/(dx*dx)
+        bb = cl/(dy*dy)
+        gg = 1.0/(4.0*dx*dy)
+        hh = 1.0/3.0
+
+        for i in numba.prange(1, nx+2):
+            for j in range(1, ny+2):
+                j1 = (w[i+1,j]-w[i-1,j])*(s[i,j+1]-s[i,j-1]) \
+                   - (w[i,j+1]-w[i,j-1])*(s[i+1,j]-s[i-1,j])
+
+                j2 = w[i+1,j]*(s[i+1,j+1]-s[i+1,j-1]) \
+                   - w[i-1,j]*(s[i-1,j+1]-s[i-1,j-1]) \
+                   - w[i,j+1]*(s[i+1,j+1]-s[i-1,j+1]) \
+                   + w[i,j-1]*(s[i+1,j-1]-s[i-1,j-1])
+
+                j3 = w[i+1,j+1]*(s[i,j+1]-s[i+1,j]) \
+                   - w[i-1,j-1]*(s[i-1,j]-s[i,j-1]) \
+                   - w[i-1,j+1]*(s[i,j+1]-s[i-1,j]) \
+                   + w[i+1,j-1]*(s[i+1,j]-s[i,j-1])
+
+                lap = aa*(w[i+1,j]-2.0*w[i,j]+w[i-1,j]) \
+                    + bb*(w[i,j+1]-2.0*w[i,j]+w[i,j-1])
+
+                f[i,j] = -gg*hh*(j1+j2+j3) + lap
+
+        return f
+
+    # all pairs in one compiled pass, pairs distributed over the cores
+    @numba.njit(parallel=True, cache=True)
+    def arakawa_jacobian_pairs(w, s, dx, dy):
+        nw = w.shape[0]
+        ns = s.shape[0]
+        nx = w.shape[1] - 3
+        ny = w.shape[2] - 3
+
+        gg = 1.0/(4.0*dx*dy)
+        hh = 1.0/3.0
+
+        jac = np.empty((nw, ns, nx+1, ny+1))
+        for m in numba.prange(nw*ns):
+            a = w[m//ns]
+            b = s[m%ns]
+            for i in range(1, nx+2):
+                for j in range(1, ny+2):
+                    j1 = (a[i+1,j]-a[i-1,j])*(b[i,j+1]-b[i,j-1]) \
+                       - (a[i,j+1]-a[i,j-1])*(b[i+1,j]-b[i-1,j])
+
+                    j2 = a[i+1,j]*(b[i+1,j+1]-b[i+1,j-1]) \
+                       - a[i-1,j]*(b[i-1,j+1]-b[i-1,j-1]) \
+                       - a[i,j+1]*(b[i+1,j+1]-b[i-1,j+1]) \
+                       + a[i,j-1]*(b[i+1,j-1]-b[i-1,j-1])
+
+                    j3 = a[i+1,j+1]*(b[i,j+1]-b[i+1,j]) \
+                       - a[i-1,j-1]*(b[i-1,j]-b[i,j-1]) \
+                       - a[i-1,j+1]*(b[i,j+1]-b[i-1,j]) \
+                       + a[i+1,j-1]*(b[i+1,j]-b[i,j-1])
+
+                    jac[m//ns,m%ns,i-1,j-1] = gg*hh*(j1+j2+j3)
+
+        return jac
+else:
+    arakawa_rhs = arakawa_rhs_numpy
+    arakawa_jacobian_pairs = arakawa_jacobian_pairs_numpy
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fast Poisson solver for periodic domains (second-order central difference)
+
+The FFTW plans, aligned buffers and the modified wavenumber denominator only
+depend on the grid, so they are built once per grid size and reused for every
+solve. FFTW wisdom can be stored on disk so that a restarted run skips the
+planning stage.
+
+With real=True the solver uses real-to-complex/complex-to-real transforms on
+the real vorticity field, which halves the FFT work and the spectral storage.
+With nbatch set, the solver works on a stack of fields f[nx,ny,nbatch] (e.g.
+all POD modes) with a single FFTW plan over the two leading axes.
+
+"""
+import os
+import numpy as np
+import pyfftw
+
+#%%
+# FFTW wisdom persistence: export_wisdom() is a tuple of plain-text byte
+# strings (double, single, long double), stored raw and separated by a NUL
+def load_wisdom(filename):
+    if filename is not None and os.path.isfile(filename):
+        with open(filename, 'rb') as f:
+            pyfftw.import_wisdom(tuple(f.read().split(b'\0')))
+
+def save_wisdom(filename):
+    if filename is not None:
+        with open(filename, 'wb') as f:
+            f.write(b'\0'.join(pyfftw.export_wisdom()))
+
+#%%
+class PoissonSolver:
+    '''
+    solves lap(u) = f on a periodic nx x ny grid (physical points only,
+    no periodic/ghost points) and returns u with zero mean
+    if nbatch is given, f and u are stacks of shape (nx,ny,nbatch)
+
+    '''
+    def __init__(self, nx, ny, dx, dy, real=False, nbatch=None, threads=1,
+                 wisdom_file=None):
+        self.nx = nx
+        self.ny = ny
+        self.dx = dx
+        self.dy = dy
+        self.real = real
+        self.nbatch = nbatch
+        self.wisdom_file = wisdom_file
+
+        epsilon = 1.0e-6
+        aa = -2.0/(dx*dx) - 2.0/(dy*dy)
+        bb = 2.0/(dx*dx)
+        cc = 2.0/(dy*dy)
+        hx = 2.0*np.pi/np.float64(nx)
+        hy = 2.0*np.pi/np.float64(ny)
+
+        kx = hx*np.float64(np.arange(0, nx))
+        ky = hy*np.float64(np.arange(0, ny))
+
+        kx[0] = epsilon
+        ky[0] = epsilon
+
+        kx, ky = np.meshgrid(np.cos(kx), np.cos(ky), indexing='ij')
+
+        self.den = aa + bb*kx + cc*ky
+
+        load_wisdom(wisdom_file)
+        wisdom = pyfftw.export_wisdom()
+
+        # trailing batch axis, transformed as independent 2D fields
+        batch = () if nbatch is None else (nbatch,)
+
+        if real:
+            # only the non-negative ky half of the spectrum is stored
+            self.den = np.ascontiguousarray(self.den[:,:ny//2+1])
+            self.a = pyfftw.empty_aligned((nx,ny)+batch, dtype='float64')
+            self.b = pyfftw.empty_aligned((nx,ny//2+1)+batch, dtype='complex128')
+        else:
+            self.a = pyfftw.empty_aligned((nx,ny)+batch, dtype='complex128')
+            self.b = pyfftw.empty_aligned((nx,ny)+batch, dtype='complex128')
+
+        if nbatch is not None:
+            self.den = self.den[:,:,np.newaxis]
+
+        self.fft_object = pyfftw.FFTW(self.a, self.b, axes=(0,1),
+                                      direction='FFTW_FORWARD', threads=threads)
+        self.fft_object_inv = pyfftw.FFTW(self.b, self.a, axes=(0,1),
+                                          direction='FFTW_BACKWARD', threads=threads)
+
+        # only rewrite the file if planning added new wisdom
+        if pyfftw.export_wisdom() != wisdom:
+            save_wisdom(wisdom_file)
+
+    def solve(self, f, out=None):
+        self.a[...] = f
+        e = self.fft_object()
+
+        e[0,0,...] = 0.0
+        np.divide(e, self.den, out=e)
+
+        ut = self.fft_object_inv()
+
+        if out is None:
+            out = np.empty(self.a.shape)
+        if self.real:
+            out[:,:] = ut
+        else:
+            out[:,:] = ut.real
+        return out
+
+#%%
+# one solver per grid, shared by all callers
+_solvers = {}
+
+def get_solver(nx, ny, dx, dy, real=False, nbatch=None, threads=1,
+               wisdom_file=None):
+    key = (nx, ny, dx, dy, real, nbatch, threads)
+    if key not in _solvers:
+        _solvers[key] = PoissonSolver(nx, ny, dx, dy, real=real, nbatch=nbatch,
+                                      threads=threads, wisdom_file=wisdom_file)
+    return _solvers[key]
@@ -14,7 +14,15 @@ Periodic boundary conditions only
 import numpy as np
 from numpy.random import seed
 seed(1)
-import pyfftw
+import os
+import sys
+# shared ROM routines, found from any working directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fast_poisson import get_solver
+from rk3_stepper import RK3Stepper
+from solver_io import checkpoint_file, save_checkpoint, load_checkpoint
+from solver_io import SnapshotWriter, AsyncSnapshotWriter, read_snapshots
+from pod import IncrementalPOD
 from scipy import integrate
 from scipy import linalg
 import matplotlib.pyplot as plt 
@@ -26,49 +34,13 @@ font = {'family' : 'Times New Roman',
 plt.rc('font', **font)
 #%%
 # fast poisson solver using second-order central difference scheme
+# FFTW plans, buffers and the denominator are cached per grid (fast_poisson.py)
 def fps(nx, ny, dx, dy, f):
-    epsilon = 1.0e-6
-    aa = -2.0/(dx*dx) - 2.0/(dy*dy)
-    bb = 2.0/(dx*dx)
-    cc = 2.0/(dy*dy)
-    hx = 2.0*np.pi/np.float64(nx)
-    hy = 2.0*np.pi/np.float64(ny)
-    
-    kx = np.empty(nx)
-    ky = np.empty(ny)
-    
-    kx[:] = hx*np.float64(np.arange(0, nx))
-
-    ky[:] = hy*np.float64(np.arange(0, ny))
-    
-    kx[0] = epsilon
-    ky[0] = epsilon
-
-    kx, ky = np.meshgrid(np.cos(kx), np.cos(ky), indexing='ij')
-    
-    data = np.empty((nx,ny), dtype='complex128')
-    data1 = np.empty((nx,ny), dtype='complex128')
-    
-    data[:,:] = np.vectorize(complex)(f[1:nx+1,1:ny+1],0.0)
-
-    a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    
-    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD')
-    fft_object_inv = pyfftw.FFTW(a, b,axes = (0,1), direction = 'FFTW_BACKWARD')
-    
-    e = fft_object(data)
-    #e = pyfftw.interfaces.scipy_fftpack.fft2(data)
-    
-    e[0,0] = 0.0
-    
-    data1[:,:] = e[:,:]/(aa + bb*kx[:,:] + cc*ky[:,:])
-
-    ut = np.real(fft_object_inv(data1))
+    solver = get_solver(nx, ny, dx, dy, real=True, wisdom_file='fftw_wisdom.dat')
     
     #periodicity
     u = np.empty((nx+3,ny+3)) 
-    u[1:nx+1,1:ny+1] = ut
+    u[1:nx+1,1:ny+1] = solver.solve(f[1:nx+1,1:ny+1])
     u[:,ny+1] = u[:,1]
     u[nx+1,:] = u[1,:]
     u[nx+1,ny+1] = u[1,1]
@@ -85,41 +57,6 @@ def bc(nx,ny,u):
     
     return u  
     
-#%% 
-# compute rhs using arakawa scheme
-# computed at all physical domain points (1:nx+1,1:ny+1; all boundary points included)
-# no ghost points
-def rhs(nx,ny,dx,dy,re,w,s):
-    aa = 1.0/(dx*dx)
-    bb = 1.0/(dy*dy)
-    gg = 1.0/(4.0*dx*dy)
-    hh = 1.0/3.0
-    
-    f = np.zeros((nx+3,ny+3))
-    
-    #Arakawa
-    j1 = gg*( (w[2:nx+3,1:ny+2]-w[0:nx+1,1:ny+2])*(s[1:nx+2,2:ny+3]-s[1:nx+2,0:ny+1]) \
-             -(w[1:nx+2,2:ny+3]-w[1:nx+2,0:ny+1])*(s[2:nx+3,1:ny+2]-s[0:nx+1,1:ny+2]))
-
-    j2 = gg*( w[2:nx+3,1:ny+2]*(s[2:nx+3,2:ny+3]-s[2:nx+3,0:ny+1]) \
-            - w[0:nx+1,1:ny+2]*(s[0:nx+1,2:ny+3]-s[0:nx+1,0:ny+1]) \
-            - w[1:nx+2,2:ny+3]*(s[2:nx+3,2:ny+3]-s[0:nx+1,2:ny+3]) \
-            + w[1:nx+2,0:ny+1]*(s[2:nx+3,0:ny+1]-s[0:nx+1,0:ny+1]))
-
-    j3 = gg*( w[2:nx+3,2:ny+3]*(s[1:nx+2,2:ny+3]-s[2:nx+3,1:ny+2]) \
-            - w[0:nx+1,0:ny+1]*(s[0:nx+1,1:ny+2]-s[1:nx+2,0:ny+1]) \
-            - w[0:nx+1,2:ny+3]*(s[1:nx+2,2:ny+3]-s[0:nx+1,1:ny+2]) \
-            + w[2:nx+3,0:ny+1]*(s[2:nx+3,1:ny+2]-s[1:nx+2,0:ny+1]) )
-
-    jac = (j1+j2+j3)*hh
-    
-    lap = aa*(w[2:nx+3,1:ny+2]-2.0*w[1:nx+2,1:ny+2]+w[0:nx+1,1:ny+2]) \
-        + bb*(w[1:nx+2,2:ny+3]-2.0*w[1:nx+2,1:ny+2]+w[1:nx+2,0:ny+1])
-        
-    f[1:nx+2,1:ny+2] = -jac + lap/re 
-                        
-    return f
-
 #%%
 # set initial condition for vortex merger problem
 def vm_ic(nx,ny,x,y):
@@ -154,8 +91,14 @@ isc = np.int64(l1[6][0])
 ich = np.int64(l1[7][0])
 ipr = np.int64(l1[8][0])
 ndc = np.int64(l1[9][0])
+ichkp = np.int64(l1[10][0])
+istart = np.int64(l1[11][0])
+ipod = np.int64(l1[12][0])
+nrpod = np.int64(l1[13][0])
 
 freq = int(nt/ns)
+nfiles = int(nt/freq) + 1 # snapshot files 0..nt/freq (ns+1 if ns divides nt)
+freq_chkp = 10*freq # checkpoint every 10 snapshot files
 
 if (ich != 19):
     print("Check input.txt file")
@@ -192,72 +135,80 @@ x, y = np.meshgrid(x, y, indexing='ij')
 w = np.empty((nx+3,ny+3)) 
 s = np.empty((nx+3,ny+3))
 
-t = np.empty((nx+3,ny+3))
-
-r = np.empty((nx+3,ny+3))
-
 #%%
 # set the initial condition based on the problem selected
 w0 = vm_ic(nx,ny,x,y)
-    
-w = np.copy(w0)
+
+snap_folder = "./snapshots/Re_1000"
+chkp_folder = "./snapshots/Re_1000/chkp"
+k0 = 0
+
+if (ichkp == 0):
+    w = np.copy(w0)
+else:
+    # restart from the checkpoint written at file number istart
+    w, k0, time = load_checkpoint(checkpoint_file(chkp_folder, istart), re, dt)
+    print("Restarting from checkpoint ", istart, " at step ", k0, " time ", time)
+
 s = fps(nx, ny, dx, dy, -w)
 s = bc(nx,ny,s)
 
-filename = "./snapshots/Re_1000/w/w_0.csv"
-np.savetxt(filename, w, delimiter=",")
-filename = "./snapshots/Re_1000/s/s_0.csv"
-np.savetxt(filename, s, delimiter=",")
+# binary snapshot store: ./snapshots/Re_1000/w.npy and s.npy, shape (nfiles,nx+3,ny+3)
+# written in a background thread, at most 4 snapshots are queued
+snapshots = AsyncSnapshotWriter(SnapshotWriter(snap_folder, ['w','s'], nfiles, (nx+3,ny+3),
+                                               restart=(ichkp != 0)), maxsize=4)
+
+# streaming POD of the vorticity snapshots (pod.py) with ipod = 1, the
+# snapshot matrix is never formed; a restarted run first ingests the
+# snapshots already stored
+pod_w = None
+if (ipod == 1):
+    pod_w = IncrementalPOD(nrpod, tol=1e-12)
+
+if (ichkp == 0):
+    snapshots.write(0, w=w, s=s)
+    if pod_w is not None:
+        pod_w.update(np.reshape(w[1:nx+1,1:ny+1],(nx)*(ny)))
+elif pod_w is not None:
+    wsnap = read_snapshots(snap_folder, 'w')
+    for n in range(int(k0/freq)+1):
+        pod_w.update(np.reshape(wsnap[n,1:nx+1,1:ny+1],(nx)*(ny)))
+    del wsnap
 
 #%%
 # time integration using third-order Runge Kutta method
-aa = 1.0/3.0
-bb = 2.0/3.0
+# work arrays are allocated once in the stepper and reused (rk3_stepper.py)
+# use_numba selects the compiled Arakawa kernel (NumPy fallback without numba)
+stepper = RK3Stepper(nx, ny, dx, dy, re, dt,
+                     solver=get_solver(nx, ny, dx, dy, real=True, wisdom_file='fftw_wisdom.dat'),
+                     use_numba=True)
 clock_time_init = tm.time()
-for k in range(1,nt+1):
+for k in range(k0+1,nt+1):
     time = time + dt
-    r = rhs(nx,ny,dx,dy,re,w,s)
-    
-    #stage-1
-    t[1:nx+2,1:ny+2] = w[1:nx+2,1:ny+2] + dt*r[1:nx+2,1:ny+2]
-    
-    t = bc(nx,ny,t)
-    
-    s = fps(nx, ny, dx, dy, -t)
-    s = bc(nx,ny,s)
-    
-    r = rhs(nx,ny,dx,dy,re,t,s)
-    
-    #stage-2
-    t[1:nx+2,1:ny+2] = 0.75*w[1:nx+2,1:ny+2] + 0.25*t[1:nx+2,1:ny+2] + 0.25*dt*r[1:nx+2,1:ny+2]
-    
-    t = bc(nx,ny,t)
-    
-    s = fps(nx, ny, dx, dy, -t)
-    s = bc(nx,ny,s)
-    
-    r = rhs(nx,ny,dx,dy,re,t,s)
-    
-    #stage-3
-    w[1:nx+2,1:ny+2] = aa*w[1:nx+2,1:ny+2] + bb*t[1:nx+2,1:ny+2] + bb*dt*r[1:nx+2,1:ny+2]
-    
-    w = bc(nx,ny,w)
-    
-    s = fps(nx, ny, dx, dy, -w)
-    s = bc(nx,ny,s)
+    stepper.step(w, s)
     
     if (k%freq == 0):
-        filename = "./snapshots/Re_1000/w/w_"+str(int(k/freq))+".csv"
-        np.savetxt(filename, w, delimiter=",")
-        filename = "./snapshots/Re_1000/s/s_"+str(int(k/freq))+".csv"
-        np.savetxt(filename, s, delimiter=",")
+        snapshots.write(int(k/freq), w=w, s=s)
+        if pod_w is not None:
+            pod_w.update(np.reshape(w[1:nx+1,1:ny+1],(nx)*(ny)))
         #u,v = compute_velocity(nx,ny,dx,dy,s)
         #compute_stress(nx,ny,nxc,nyc,dxc,dyc,u,v,k,freq)
         #write_data(nx,ny,dx,dy,nxc,nyc,dxc,dyc,w,s,k,freq)
         
+    if (k%freq_chkp == 0):
+        snapshots.flush()
+        save_checkpoint(checkpoint_file(chkp_folder, k/freq), w, k, time, re, dt)
+        
     if (k%(10*freq) == 0):
         print(k, " ", time)
 
+snapshots.close()
+
+if pod_w is not None:
+    PHIw, Lw, RICw = pod_w.basis()
+    np.savez(snap_folder+"/pod_w.npz", PHIw=PHIw, L=Lw, RIC=RICw, nsnap=pod_w.nsnap)
+    print('Streaming POD: ', pod_w.nsnap, ' snapshots, RIC = ', RICw)
+
 total_clock_time = tm.time() - clock_time_init
 print('Total clock time=', total_clock_time)
 
@@ -8,8 +8,17 @@ Created on Mon Oct  7 17:41:10 2019
 import numpy as np
 import matplotlib.pyplot as plt
 from numpy import linalg as LA
+import os
+import sys
+# shared ROM routines, found from any working directory
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from galerkin import rhs, ab3_batch
+from pod import POD, PODproj, PODrec
+from grassmann import MultiChartGrassmann
 from scipy.integrate import simps
-import pyfftw
+from fast_poisson import get_solver
+from ns2d_galerkin import linear_operator, nonlinear_operator, GalerkinOperators
+from solver_io import ObservedSnapshots
 
 from numpy.random import seed
 seed(1)
@@ -17,7 +26,6 @@ from tensorflow import set_random_seed
 set_random_seed(2)
 import pandas as pd
 import time as clck
-import os
 
 from keras.models import Sequential
 from keras.layers import Dense
@@ -46,69 +54,6 @@ mpl.rcParams['text.latex.preamble'] = [r'\usepackage{amsmath}']
 
 #%% Define Functions
 
-###############################################################################
-#POD Routines
-###############################################################################         
-def POD(u,R): #Basis Construction
-    n,ns = u.shape
-    U,S,Vh = LA.svd(u, full_matrices=False)
-    Phi = U[:,:R]  
-    L = S**2
-    #compute RIC (relative inportance index)
-    RIC = sum(L[:R])/sum(L)*100   
-    return Phi,L,RIC
-
-def PODproj(u,Phi): #Projection
-    a = np.dot(u.T,Phi)  # u = Phi * a.T
-    return a
-
-def PODrec(a,Phi): #Reconstruction    
-    u = np.dot(Phi,a.T)    
-    return u
-
-
-###############################################################################
-#Interpolation Routines
-###############################################################################  
-# Grassmann Interpolation
-def GrassInt(Phi,pref,p,pTest):
-    # Phi is input basis [training]
-    # pref is the reference basis [arbitrarty] for Grassmann interpolation
-    # p is the set of training parameters
-    # pTest is the testing parameter
-    
-    nx,nr,nc = Phi.shape
-    Phi0 = Phi[:,:,pref] 
-    Phi0H = Phi0.T 
-
-    print('Calculating Gammas...')
-    Gamma = np.zeros((nx,nr,nc))
-    for i in range(nc):
-        templ = ( np.identity(nx) - Phi0.dot(Phi0H) )
-        tempr = LA.inv( Phi0H.dot(Phi[:,:,i]) )
-        temp = LA.multi_dot([templ,Phi[:,:,i],tempr])
-               
-        U, S, Vh = LA.svd(temp, full_matrices=False)
-        S = np.diag(S)
-        Gamma[:,:,i] = LA.multi_dot([U,np.arctan(S),Vh])
-    
-    print('Interpolating ...')
-    alpha = np.ones(nc)
-    GammaL = np.zeros((nx,nr))
-    #% Lagrange Interpolation
-    for i in range(nc):
-        for j in range(nc):
-            if (j != i) :
-                alpha[i] = alpha[i]*(pTest-p[j])/(p[i]-p[j])
-    for i in range(nc):
-        GammaL = GammaL + alpha[i] * Gamma[:,:,i]
-            
-    U, S, Vh = LA.svd(GammaL, full_matrices=False)
-    PhiL = LA.multi_dot([ Phi0 , Vh.T ,np.diag(np.cos(S)) ]) + \
-           LA.multi_dot([ U , np.diag(np.sin(S)) ])
-    PhiL = PhiL.dot(Vh)
-    return PhiL
-
 ###############################################################################
 #LSTM Routines
 ############################################################################### 
@@ -125,23 +70,6 @@ def create_training_data_lstm(training_set, m, n, lookback):
 
 
 
-def rhs(nr, b_l, b_nl, a): # Right Handside of Galerkin Projection
-    r2, r3, r = [np.zeros(nr) for _ in range(3)]
-    
-    for k in range(nr):
-        r2[k] = 0.0
-        for i in range(nr):
-            r2[k] = r2[k] + b_l[i,k]*a[i]
-    
-    for k in range(nr):
-        r3[k] = 0.0
-        for j in range(nr):
-            for i in range(nr):
-                r3[k] = r3[k] + b_nl[i,j,k]*a[i]*a[j]
-    
-    r = r2 + r3    
-    return r
-
 def plot_3d_surface(x,t,field):
     
     fig = plt.figure(figsize=(8,6))
@@ -160,135 +88,15 @@ def plot_3d_surface(x,t,field):
     fig.savefig('3d.pdf')
 
 #%% fast poisson solver using second-order central difference scheme
-def fpsi(nx, ny, dx, dy, f):
-    epsilon = 1.0e-6
-    aa = -2.0/(dx*dx) - 2.0/(dy*dy)
-    bb = 2.0/(dx*dx)
-    cc = 2.0/(dy*dy)
-    hx = 2.0*np.pi/np.float64(nx)
-    hy = 2.0*np.pi/np.float64(ny)
-    
-    kx = np.empty(nx)
-    ky = np.empty(ny)
-    
-    kx[:] = hx*np.float64(np.arange(0, nx))
-
-    ky[:] = hy*np.float64(np.arange(0, ny))
-    
-    kx[0] = epsilon
-    ky[0] = epsilon
-
-    kx, ky = np.meshgrid(np.cos(kx), np.cos(ky), indexing='ij')
-    
-    data = np.empty((nx,ny), dtype='complex128')
-    data1 = np.empty((nx,ny), dtype='complex128')
-    
-    data[:,:] = np.vectorize(complex)(f,0.0)
-
-    a = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    b = pyfftw.empty_aligned((nx,ny),dtype= 'complex128')
-    
-    fft_object = pyfftw.FFTW(a, b, axes = (0,1), direction = 'FFTW_FORWARD')
-    fft_object_inv = pyfftw.FFTW(a, b,axes = (0,1), direction = 'FFTW_BACKWARD')
-    
-    e = fft_object(data)
-    #e = pyfftw.interfaces.scipy_fftpack.fft2(data)
+# FFTW plans, buffers and the denominator are cached per grid (fast_poisson.py)
+# solves a stack of fields f[nx,ny,nbatch] (e.g. all modes) with one FFTW plan
+def fpsi_batch(nx, ny, dx, dy, f):
+    solver = get_solver(nx, ny, dx, dy, real=True, nbatch=f.shape[2],
+                        wisdom_file='fftw_wisdom.dat')
+    ut = solver.solve(f)
     
-    e[0,0] = 0.0
-    
-    data1[:,:] = e[:,:]/(aa + bb*kx[:,:] + cc*ky[:,:])
-
-    ut = np.real(fft_object_inv(data1))
-        
     return ut
 
-#%%
-def nonlinear_term(nx,ny,dx,dy,wf,sf):
-    '''
-    this function returns -(Jacobian)
-    
-    '''
-    w = np.zeros((nx+3,ny+3))
-    
-    w[1:nx+1,1:ny+1] = wf
-    
-    # periodic
-    w[:,ny+1] = w[:,1]
-    w[nx+1,:] = w[1,:]
-    w[nx+1,ny+1] = w[1,1]
-    
-    # ghost points
-    w[:,0] = w[:,ny]
-    w[:,ny+2] = w[:,2]
-    w[0,:] = w[nx,:]
-    w[nx+2,:] = w[2,:]
-    
-    s = np.zeros((nx+3,ny+3))
-    
-    s[1:nx+1,1:ny+1] = sf
-    
-    # periodic
-    s[:,ny+1] = s[:,1]
-    s[nx+1,:] = s[1,:]
-    s[nx+1,ny+1] = s[1,1]
-    
-    # ghost points
-    s[:,0] = s[:,ny]
-    s[:,ny+2] = s[:,2]
-    s[0,:] = s[nx,:]
-    s[nx+2,:] = s[2,:]
-    
-    gg = 1.0/(4.0*dx*dy)
-    hh = 1.0/3.0
-    
-    f = np.zeros((nx+1,ny+1))
-    
-    #Arakawa
-    j1 = gg*( (w[2:nx+3,1:ny+2]-w[0:nx+1,1:ny+2])*(s[1:nx+2,2:ny+3]-s[1:nx+2,0:ny+1]) \
-             -(w[1:nx+2,2:ny+3]-w[1:nx+2,0:ny+1])*(s[2:nx+3,1:ny+2]-s[0:nx+1,1:ny+2]))
-
-    j2 = gg*( w[2:nx+3,1:ny+2]*(s[2:nx+3,2:ny+3]-s[2:nx+3,0:ny+1]) \
-            - w[0:nx+1,1:ny+2]*(s[0:nx+1,2:ny+3]-s[0:nx+1,0:ny+1]) \
-            - w[1:nx+2,2:ny+3]*(s[2:nx+3,2:ny+3]-s[0:nx+1,2:ny+3]) \
-            + w[1:nx+2,0:ny+1]*(s[2:nx+3,0:ny+1]-s[0:nx+1,0:ny+1]))
-
-    j3 = gg*( w[2:nx+3,2:ny+3]*(s[1:nx+2,2:ny+3]-s[2:nx+3,1:ny+2]) \
-            - w[0:nx+1,0:ny+1]*(s[0:nx+1,1:ny+2]-s[1:nx+2,0:ny+1]) \
-            - w[0:nx+1,2:ny+3]*(s[1:nx+2,2:ny+3]-s[0:nx+1,1:ny+2]) \
-            + w[2:nx+3,0:ny+1]*(s[2:nx+3,1:ny+2]-s[1:nx+2,0:ny+1]) )
-
-    f = -(j1+j2+j3)*hh
-                  
-    return f[1:nx+1,1:ny+1]
-
-def linear_term(nx,ny,dx,dy,re,f):
-    w = np.zeros((nx+3,ny+3))
-    
-    w[1:nx+1,1:ny+1] = f
-    
-    # periodic
-    w[:,ny+1] = w[:,1]
-    w[nx+1,:] = w[1,:]
-    w[nx+1,ny+1] = w[1,1]
-    
-    # ghost points
-    w[:,0] = w[:,ny]
-    w[:,ny+2] = w[:,2]
-    w[0,:] = w[nx,:]
-    w[nx+2,:] = w[2,:]
-    
-    aa = 1.0/(dx*dx)
-    bb = 1.0/(dy*dy)
-    
-    f = np.zeros((nx+1,ny+1))
-    
-    lap = aa*(w[2:nx+3,1:ny+2]-2.0*w[1:nx+2,1:ny+2]+w[0:nx+1,1:ny+2]) \
-        + bb*(w[1:nx+2,2:ny+3]-2.0*w[1:nx+2,1:ny+2]+w[1:nx+2,0:ny+1])
-    
-    f = lap/re
-            
-    return f[1:nx+1,1:ny+1]
-
 def pbc(w):
     f = np.zeros((nx+1,ny+1))
     f[:nx,:ny] = w
@@ -316,6 +124,7 @@ dt = 1e-1
 tm = 20.0
 
 noise = 0.3
+pod_method = 'snapshots' # POD backend: 'svd', 'snapshots' or 'randomized' (pod.py)
 
 ReTest = 1000
 
@@ -324,22 +133,12 @@ x = np.linspace(0, lx, nx+1)
 y = np.linspace(0, ly, ny+1)
 t = np.linspace(0, tm, ns+1)
 
-um = np.zeros(((nx)*(ny), ns+1, nc))
-up = np.zeros(((nx)*(ny), ns+1, nc))
-uo = np.zeros(((nx)*(ny), ns+1, nc))
-
-for p in range(0,nc):
-    for n in range(0,ns+1):
-        file_input = "./snapshots/Re_"+str(int(Re[p]))+"/w/w_"+str(int(n))+ ".csv"
-        w = np.genfromtxt(file_input, delimiter=',')
-        
-        w1 = w[1:nx+1,1:ny+1]
-        
-        um[:,n,p] = np.reshape(w1,(nx)*(ny)) #snapshots from unperturbed solution
-        up[:,n,p] = noise*um[:,n,p] #perturbation (unknown physics)
-        uo[:,n,p] = um[:,n,p] + up[:,n,p] #snapshots from observed solution
+# observed snapshots uo = um + noise*um, built per parameter from the
+# memory-mapped snapshot store (um and up are not stored)
+uo = ObservedSnapshots(["./snapshots/Re_"+str(int(Re[p])) for p in range(nc)],
+                       nx, ny, ns, noise)
 
-#plot_3d_surface(x,t,uo[:,:,-1])
+#plot_3d_surface(x,t,uo[-1])
 
 #%% POD basis computation
 PHIw = np.zeros(((nx)*(ny),nr,nc))
@@ -350,22 +149,20 @@ RIC = np.zeros((nc))    #Relative information content
 
 print('Computing POD basis for vorticity ...')
 for p in range(0,nc):
-    u = uo[:,:,p]
-    PHIw[:,:,p], L[:,p], RIC[p]  = POD(u, nr) 
+    u = uo[p]
+    PHIw[:,:,p], L[:,p], RIC[p]  = POD(u, nr, pod_method) 
 
 #%%    
 print('Computing POD basis for streamfunction ...')
-for p in range(0,nc):
-    for i in range(nr):
-        phi_w = np.reshape(PHIw[:,i,p],[nx,ny])
-        phi_s = fpsi(nx, ny, dx, dy, -phi_w)
-        PHIs[:,i,p] = np.reshape(phi_s,(nx)*(ny))
+phi_w = np.reshape(PHIw,[nx,ny,nr*nc])
+phi_s = fpsi_batch(nx, ny, dx, dy, -phi_w)
+PHIs[:,:,:] = np.reshape(phi_s,[(nx)*(ny),nr,nc])
 
 #%% Calculating true POD coefficients (observed)
 at = np.zeros((ns+1,nr,nc))
 print('Computing true POD coefficients...')
 for p in range(nc):
-    at[:,:,p] = PODproj(uo[:,:,p],PHIw[:,:,p])
+    at[:,:,p] = PODproj(uo[p],PHIw[:,:,p])
 
 print('Reconstructing with true coefficients')
 w = PODrec(at[:,:,1],PHIw[:,:,1])
@@ -389,58 +186,28 @@ fig.savefig("reconstructed.eps", bbox_inches = 'tight')
 ###############################
 b_l = np.zeros((nr,nr,nc))
 b_nl = np.zeros((nr,nr,nr,nc))
-linear_phi = np.zeros(((nx)*(ny),nr,nc))
-nonlinear_phi = np.zeros(((nx)*(ny),nr,nc))
 
 #%% linear term   
 for p in range(nc):
-    for i in range(nr):
-        phi_w = np.reshape(PHIw[:,i,p],[nx,ny])
-        
-        lin_term = linear_term(nx,ny,dx,dy,Re[p],phi_w)
-        linear_phi[:,i,p] = np.reshape(lin_term,(nx)*(ny))
-
-for p in range(nc):
-    for k in range(nr):
-        for i in range(nr):
-            b_l[i,k,p] = np.dot(linear_phi[:,i,p].T , PHIw[:,k,p]) 
+    b_l[:,:,p] = linear_operator(nx,ny,dx,dy,PHIw[:,:,p],Re[p])
                    
 #%% nonlinear term 
+# all nr*nr Jacobians in one stencil pass, projected with one matrix product
 for p in range(nc):
-    for i in range(nr):
-        phi_w = np.reshape(PHIw[:,i,p],[nx,ny])
-        for j in range(nr):  
-            phi_s = np.reshape(PHIs[:,j,p],[nx,ny])
-            nonlin_term = nonlinear_term(nx,ny,dx,dy,phi_w,phi_s)
-            jacobian_phi = np.reshape(nonlin_term,(nx)*(ny))
-            for k in range(nr):    
-                b_nl[i,j,k,p] = np.dot(jacobian_phi.T, PHIw[:,k,p]) 
+    b_nl[:,:,:,p] = nonlinear_operator(nx,ny,dx,dy,PHIw[:,:,p],PHIs[:,:,p])
 
 #%% solving ROM by Adams-Bashforth scheme          
-aGP = np.zeros((ns+1,nr,nc))
-for p in range(nc):
-    aGP[0,:,p] = at[0,:nr,p]
-    aGP[1,:,p] = at[1,:nr,p]
-    aGP[2,:,p] = at[2,:nr,p]
-    for k in range(3,ns+1):
-        r1 = rhs(nr, b_l[:,:,p], b_nl[:,:,:,p], aGP[k-1,:,p])
-        r2 = rhs(nr, b_l[:,:,p], b_nl[:,:,:,p], aGP[k-2,:,p])
-        r3 = rhs(nr, b_l[:,:,p], b_nl[:,:,:,p], aGP[k-3,:,p])
-        temp= (23/12) * r1 - (16/12) * r2 + (5/12) * r3
-        aGP[k,:,p] = aGP[k-1,:,p] + dt*temp 
+# all parameters are integrated at once, parameter index first
+aGP = ab3_batch(np.moveaxis(b_l,-1,0), np.moveaxis(b_nl,-1,0),
+                np.moveaxis(at[:3,:nr,:],-1,0), dt, ns)
+aGP = np.moveaxis(aGP,0,-1) # (ns+1,nr,nc)
         
 #%% solving ROM by Adams-Bashforth scheme          
-aGPm = np.zeros((ns+1,nr,nc))
-for p in range(nc):
-    aGPm[0,:,p] = at[0,:nr,p]
-    aGPm[1,:,p] = at[1,:nr,p]
-    aGPm[2,:,p] = at[2,:nr,p]
-    for k in range(3,ns+1):
-        r1 = rhs(nr, b_l[:,:,p], b_nl[:,:,:,p], at[k-1,:,p])
-        r2 = rhs(nr, b_l[:,:,p], b_nl[:,:,:,p], at[k-2,:,p])
-        r3 = rhs(nr, b_l[:,:,p], b_nl[:,:,:,p], at[k-3,:,p])
-        temp= (23/12) * r1 - (16/12) * r2 + (5/12) * r3
-        aGPm[k,:,p] = at[k-1,:,p] + dt*temp 
+# rhs evaluated on the true coefficients, all parameters at once
+atrue = np.moveaxis(at[:,:nr,:],-1,0)
+aGPm = ab3_batch(np.moveaxis(b_l,-1,0), np.moveaxis(b_nl,-1,0),
+                 atrue[:,:3,:], dt, ns, atrue=atrue)
+aGPm = np.moveaxis(aGPm,0,-1) # (ns+1,nr,nc)
         
 #%%
 def plot_data(t,at,aGP,aGPm):
@@ -498,7 +265,7 @@ def plot_data(t,at,aGP,filename):
     
     for i in range(nrs):
         #for k in range(at.shape[2]):
-        ax[i].plot(t,at[:,i],label=str(k))
+        ax[i].plot(t,at[:,i],label=str(i))
         #ax[i].legend(loc=0)
         #ax[i].plot(t,aGP[:,i],label=r'Exact Values')
         #ax[i].plot(t,aGPm[:,i],'r-.',label=r'True Values')
@@ -616,20 +383,9 @@ model.save(filename)
 #%% Testing
 # Data generation for testing
 
-uTest = np.zeros((nx*ny, ns+1))
-upTest = np.zeros((nx*ny, ns+1))
-uoTest = np.zeros((nx*ny, ns+1))
 nuTest = 1/ReTest
 
-for n in range(ns+1):
-   file_input = "./snapshots/Re_"+str(int(ReTest))+"/w/w_"+str(int(n))+ ".csv"
-   w = np.genfromtxt(file_input, delimiter=',')
-    
-   w1 = w[1:nx+1,1:ny+1]
-    
-   uTest[:,n] = np.reshape(w1,(nx)*(ny)) #snapshots from unperturbed solution
-   upTest[:,n] = noise*uTest[:,n] #perturbation (unknown physics)
-   uoTest[:,n] = uTest[:,n] + upTest[:,n] #snapshots from observed solution
+uoTest = ObservedSnapshots(["./snapshots/Re_"+str(int(ReTest))], nx, ny, ns, noise)[0]
 
 w_fom = uoTest[:,-1] # last time step
 w_fom = np.reshape(w_fom,[nx,ny])
@@ -637,15 +393,19 @@ w_fom = pbc(w_fom)
 
 #% POD basis computation     
 print('Computing testing POD basis...')
-PHItrue, Ltrue, RICtrue  = POD(uoTest, nr) 
+PHItrue, Ltrue, RICtrue  = POD(uoTest, nr, pod_method) 
         
 #% Calculating true POD coefficients
 print('Computing testing POD coefficients...')
 aTrue = PODproj(uoTest,PHItrue)
 
 #%% Basis Interpolation
-pref = 2 #Reference case in [0:nRe]
-PHIwtest = GrassInt(PHIw,pref,nu,nuTest)
+# the reference basis is the training case nearest to the test parameter,
+# on a local chart; further test parameters only need grass.query
+grass = MultiChartGrassmann(PHIw,nu)
+pref = grass.reference(nuTest) #Reference case in [0:nRe]
+print('Reference case for Grassmann interpolation: ', pref)
+PHIwtest = grass.query(nuTest)
 aTest = PODproj(uoTest,PHIwtest)
 
 print('Reconstructing with true coefficients for test Re')
@@ -657,34 +417,16 @@ w_test = pbc(w_test)
 
 PHIstest = np.zeros(((nx)*(ny),nr))
 
-for i in range(nr):
-    phi_w = np.reshape(PHIwtest[:,i],[nx,ny])
-    phi_s = fpsi(nx, ny, dx, dy, -phi_w)    
-    PHIstest[:,i] = np.reshape(phi_s,(nx)*(ny))
+phi_w = np.reshape(PHIwtest,[nx,ny,nr])
+phi_s = fpsi_batch(nx, ny, dx, dy, -phi_w)    
+PHIstest[:,:] = np.reshape(phi_s,[(nx)*(ny),nr])
 
 #%%
-b_l = np.zeros((nr,nr))
-b_nl = np.zeros((nr,nr,nr))
-linear_phi = np.zeros(((nx)*(ny),nr))
-nonlinear_phi = np.zeros(((nx)*(ny),nr))
- 
-for k in range(nr):
-    phi_w = np.reshape(PHIwtest[:,k],[nx,ny])
-    lin_term = linear_term(nx,ny,dx,dy,ReTest,phi_w)
-    linear_phi[:,k] = np.reshape(lin_term,(nx)*(ny))
-
-for k in range(nr):
-    for i in range(nr):
-        b_l[i,k] = np.dot(linear_phi[:,i].T , PHIwtest[:,k]) 
-                   
-for i in range(nr):
-    phi_w = np.reshape(PHIwtest[:,i],[nx,ny])
-    for j in range(nr):  
-        phi_s = np.reshape(PHIstest[:,j],[nx,ny])
-        nonlin_term = nonlinear_term(nx,ny,dx,dy,phi_w,phi_s)
-        jacobian_phi = np.reshape(nonlin_term,(nx)*(ny))
-        for k in range(nr):    
-            b_nl[i,j,k] = np.dot(jacobian_phi.T, PHIwtest[:,k]) 
+# operators assembled once for the interpolated basis; another test
+# Reynolds number only needs ops.b_l(re)
+ops = GalerkinOperators(nx,ny,dx,dy,PHIwtest,PHIstest)
+b_l = ops.b_l(ReTest)
+b_nl = ops.b_nl
        
 aGPtest = np.zeros((ns+1,nr))
 aGPtest[0,:] = aTest[0,:nr]
@@ -792,8 +534,8 @@ def plot_data_allmodes(t,at,aTest,filename):
     
     for i in range(nrs):
         #for k in range(at.shape[2]):
-        ax[i].plot(t,at[:,i],label=str(k))
-        ax[i].plot(t,aTest[:,i],'k--',label=str(k))
+        ax[i].plot(t,at[:,i],label=str(i))
+        ax[i].plot(t,aTest[:,i],'k--',label=str(i))
         #ax[i].legend(loc=0)
         #ax[i].plot(t,aGP[:,i],label=r'Exact Values')
         #ax[i].plot(t,aGPm[:,i],'r-.',label=r'True Values')
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Galerkin operators of the 2D vorticity equation for the ns2d hybrid scripts
+
+    b_l[i,k]    = <lap(PHIw[:,i])/re, PHIw[:,k]>
+    b_nl[i,j,k] = <-J(PHIw[:,i], PHIs[:,j]), PHIw[:,k]>
+
+The modes are stored as columns of (nx*ny, nr) matrices. All modes are
+padded with periodic/ghost points once, the nr*nr Arakawa Jacobians are
+evaluated in one stencil pass over all pairs (arakawa.py) and projected on all
+modes with a single matrix product. With chunk set, the Jacobians are
+evaluated for chunk modes i at a time to bound the memory of the
+(chunk, nr, nx, ny) temporaries.
+
+"""
+import numpy as np
+from arakawa import arakawa_jacobian_pairs
+
+# (..., nx, ny) -> (..., nx+3, ny+3); index 1:nx+1 is the field, nx+1 is
+# the periodic copy of 1 and 0, nx+2 are the ghost points
+def pad_periodic(f):
+    pad = [(0,0)]*(f.ndim-2) + [(1,2),(1,2)]
+    return np.pad(f, pad, mode='wrap')
+
+def nonlinear_operator(nx, ny, dx, dy, PHIw, PHIs, chunk=None):
+    nr = PHIw.shape[1]
+    w = pad_periodic(np.reshape(PHIw.T, [nr,nx,ny]))
+    s = pad_periodic(np.reshape(PHIs.T, [nr,nx,ny]))
+
+    if chunk is None:
+        chunk = nr
+
+    b_nl = np.zeros((nr,nr,nr))
+    for i in range(0, nr, chunk):
+        jac = arakawa_jacobian_pairs(w[i:i+chunk], s, dx, dy)
+        # Jacobian at points (2:nx+2,2:ny+2) of the padded fields
+        jac = np.reshape(jac[...,1:nx+1,1:ny+1], (-1, nx*ny))
+        b_nl[i:i+chunk] = - np.reshape(np.dot(jac, PHIw), (-1, nr, nr))
+
+    return b_nl
+
+# b_l[i,k] = <lap(PHIw[:,i])/re, PHIw[:,k]>, second-order central Laplacian
+def linear_operator(nx, ny, dx, dy, PHIw, re):
+    nr = PHIw.shape[1]
+    w = pad_periodic(np.reshape(PHIw.T, [nr,nx,ny]))
+
+    aa = 1.0/(dx*dx)
+    bb = 1.0/(dy*dy)
+
+    # Laplacian at points (2:nx+2,2:ny+2) of the padded fields
+    lap = aa*(w[:,3:nx+3,2:ny+2]-2.0*w[:,2:nx+2,2:ny+2]+w[:,1:nx+1,2:ny+2]) \
+        + bb*(w[:,2:nx+2,3:ny+3]-2.0*w[:,2:nx+2,2:ny+2]+w[:,2:nx+2,1:ny+1])
+
+    b_l = np.dot(np.reshape(lap, (nr, nx*ny)), PHIw)/re
+    return b_l
+
+class GalerkinOperators:
+    '''
+    l0 = <lap(PHIw), PHIw> and b_nl are assembled once per basis;
+    b_l(re) = l0/re, with an array re the (len(re), nr, nr) stack
+
+    '''
+    def __init__(self, nx, ny, dx, dy, PHIw, PHIs, chunk=None):
+        self.l0 = linear_operator(nx, ny, dx, dy, PHIw, 1.0)
+        self.b_nl = nonlinear_operator(nx, ny, dx, dy, PHIw, PHIs, chunk)
+
+    def b_l(self, re):
+        return np.multiply.outer(1.0/np.asarray(re), self.l0)
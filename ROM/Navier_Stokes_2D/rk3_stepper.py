@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Allocation-free third-order Runge-Kutta stepper for the vorticity-stream
+function solver (Arakawa scheme, periodic boundary conditions)
+
+All work arrays are allocated once in the constructor; the Arakawa Jacobian,
+the Laplacian, the RK3 stage updates and the Poisson solves are evaluated
+into these buffers with out= semantics. With use_numba=True (and numba
+installed) the rhs is evaluated by the fused compiled kernel in arakawa.py.
+
+Arrays w, s are (nx+3, ny+3) with ghost points at index 0 and nx+2 (ny+2),
+same layout as in fdm_vortex_merge_vectorized.py
+
+"""
+import numpy as np
+from fast_poisson import get_solver
+from arakawa import arakawa_rhs, HAVE_NUMBA
+
+class RK3Stepper:
+    def __init__(self, nx, ny, dx, dy, re, dt, solver=None, use_numba=False):
+        self.nx = nx
+        self.ny = ny
+        self.dx = dx
+        self.dy = dy
+        self.re = re
+        self.dt = dt
+
+        # falls back to the NumPy path when numba is not available
+        self.use_numba = use_numba and HAVE_NUMBA
+
+        if solver is None:
+            solver = get_solver(nx, ny, dx, dy, real=True)
+        self.solver = solver
+
+        # temporary vorticity and rhs arrays
+        self.t = np.zeros((nx+3,ny+3))
+        self.r = np.zeros((nx+3,ny+3))
+
+        # work arrays on the (nx+1, ny+1) computational points
+        self.jac = np.empty((nx+1,ny+1))
+        self.tmp1 = np.empty((nx+1,ny+1))
+        self.tmp2 = np.empty((nx+1,ny+1))
+
+        # stencil index ranges: minus, center, plus
+        self.im = slice(0,nx+1)
+        self.ic = slice(1,nx+2)
+        self.ip = slice(2,nx+3)
+        self.jm = slice(0,ny+1)
+        self.jc = slice(1,ny+2)
+        self.jp = slice(2,ny+3)
+
+    # set periodic boundary condition for ghost nodes (in place)
+    def bc(self, u):
+        nx, ny = self.nx, self.ny
+        u[:,0] = u[:,ny]
+        u[:,ny+2] = u[:,2]
+
+        u[0,:] = u[nx,:]
+        u[nx+2,:] = u[2,:]
+
+    # streamfunction s from vorticity w: lap(s) = -w (in place)
+    def poisson(self, w, s):
+        nx, ny = self.nx, self.ny
+        si = s[1:nx+1,1:ny+1]
+        self.solver.solve(w[1:nx+1,1:ny+1], out=si)
+        np.negative(si, out=si)
+
+        #periodicity
+        s[:,ny+1] = s[:,1]
+        s[nx+1,:] = s[1,:]
+        s[nx+1,ny+1] = s[1,1]
+
+        self.bc(s)
+
+    # acc += sign*a*(b-c)
+    def _add_term(self, acc, sign, a, b, c):
+        t1 = self.tmp1
+        np.subtract(b, c, out=t1)
+        np.multiply(a, t1, out=t1)
+        if sign > 0:
+            np.add(acc, t1, out=acc)
+        else:
+            np.subtract(acc, t1, out=acc)
+
+    # rhs using arakawa scheme at all physical domain points (1:nx+2,1:ny+2)
+    def rhs(self, w, s, out):
+        if self.use_numba:
+            return arakawa_rhs(w, s, out, self.dx, self.dy, 1.0/self.re)
+
+        im, ic, ip = self.im, self.ic, self.ip
+        jm, jc, jp = self.jm, self.jc, self.jp
+        jac, t1, t2 = self.jac, self.tmp1, self.tmp2
+
+        aa = 1.0/(self.dx*self.dx)
+        bb = 1.0/(self.dy*self.dy)
+        gg = 1.0/(4.0*self.dx*self.dy)
+        hh = 1.0/3.0
+
+        #Arakawa j1
+        np.subtract(w[ip,jc], w[im,jc], out=jac)
+        np.subtract(s[ic,jp], s[ic,jm], out=t2)
+        np.multiply(jac, t2, out=jac)
+        np.subtract(w[ic,jp], w[ic,jm], out=t1)
+        np.subtract(s[ip,jc], s[im,jc], out=t2)
+        np.multiply(t1, t2, out=t1)
+        np.subtract(jac, t1, out=jac)
+
+        #Arakawa j2
+        self._add_term(jac,  1, w[ip,jc], s[ip,jp], s[ip,jm])
+        self._add_term(jac, -1, w[im,jc], s[im,jp], s[im,jm])
+        self._add_term(jac, -1, w[ic,jp], s[ip,jp], s[im,jp])
+        self._add_term(jac,  1, w[ic,jm], s[ip,jm], s[im,jm])
+
+        #Arakawa j3
+        self._add_term(jac,  1, w[ip,jp], s[ic,jp], s[ip,jc])
+        self._add_term(jac, -1, w[im,jm], s[im,jc], s[ic,jm])
+        self._add_term(jac, -1, w[im,jp], s[ic,jp], s[im,jc])
+        self._add_term(jac,  1, w[ip,jm], s[ip,jc], s[ic,jm])
+
+        f = out[ic,jc]
+        np.multiply(jac, -gg*hh, out=f)
+
+        # laplacian/re
+        np.add(w[ip,jc], w[im,jc], out=t1)
+        np.multiply(w[ic,jc], 2.0, out=t2)
+        np.subtract(t1, t2, out=t1)
+        np.multiply(t1, aa/self.re, out=t1)
+        np.add(f, t1, out=f)
+
+        np.add(w[ic,jp], w[ic,jm], out=t1)
+        np.subtract(t1, t2, out=t1)
+        np.multiply(t1, bb/self.re, out=t1)
+        np.add(f, t1, out=f)
+
+        return out
+
+    # advance w (and s) by one time step, in place
+    def step(self, w, s):
+        ic, jc = self.ic, self.jc
+        dt = self.dt
+        t, r = self.t, self.r
+        wi, ti, ri = w[ic,jc], t[ic,jc], r[ic,jc]
+        t1 = self.tmp1
+
+        self.rhs(w, s, r)
+
+        #stage-1
+        np.multiply(ri, dt, out=ti)
+        np.add(ti, wi, out=ti)
+
+        self.bc(t)
+        self.poisson(t, s)
+        self.rhs(t, s, r)
+
+        #stage-2
+        np.multiply(ti, 0.25, out=ti)
+        np.multiply(wi, 0.75, out=t1)
+        np.add(ti, t1, out=ti)
+        np.multiply(ri, 0.25*dt, out=t1)
+        np.add(ti, t1, out=ti)
+
+        self.bc(t)
+        self.poisson(t, s)
+        self.rhs(t, s, r)
+
+        #stage-3
+        aa = 1.0/3.0
+        bb = 2.0/3.0
+        np.multiply(wi, aa, out=wi)
+        np.multiply(ti, bb, out=t1)
+        np.add(wi, t1, out=wi)
+        np.multiply(ri, bb*dt, out=t1)
+        np.add(wi, t1, out=wi)
+
+        self.bc(w)
+        self.poisson(w, s)
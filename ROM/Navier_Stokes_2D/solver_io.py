@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Input/output routines for the FDM vortex-merger solver
+
+Checkpoints store the full solver state (vorticity with ghost points, time
+step index and time) in a binary .npz file. The streamfunction and the RK3
+stage arrays are recomputed from w on restart, so they are not stored.
+
+Snapshots are stored in one binary .npy file per field and Reynolds number
+(e.g. ./snapshots/Re_1000/w.npy), time-major with shape (nsnap, nx+3, ny+3),
+so that each snapshot is one contiguous chunk. Both the FDM solver (writer)
+and the ROM scripts (reader) access these files through memory maps.
+AsyncSnapshotWriter hands snapshot copies to a background thread through a
+bounded queue, so the time integration does not wait for the disk.
+ObservedSnapshots builds the observed snapshot matrices of the ROM scripts
+lazily, one parameter at a time, from the memory-mapped store.
+
+"""
+import os
+import queue
+import threading
+import numpy as np
+from numpy.lib.format import open_memmap
+from cache_io import atomic_savez
+
+#%%
+# checkpoint/restart
+def checkpoint_file(folder, n):
+    return os.path.join(folder, "chkp_"+str(int(n))+".npz")
+
+# written atomically, a crash during the write never leaves a corrupted
+# checkpoint behind (cache_io.py)
+def save_checkpoint(filename, w, k, time, re, dt):
+    atomic_savez(filename, w=w, k=k, time=time, re=re, dt=dt)
+
+def load_checkpoint(filename, re=None, dt=None):
+    with np.load(filename) as data:
+        w = data['w']
+        k = int(data['k'])
+        time = float(data['time'])
+
+        if re is not None and not np.isclose(data['re'], re):
+            raise ValueError("checkpoint "+filename+" was written for Re = "+str(float(data['re'])))
+        if dt is not None and not np.isclose(data['dt'], dt):
+            raise ValueError("checkpoint "+filename+" was written for dt = "+str(float(data['dt'])))
+
+    return w, k, time
+
+#%%
+# snapshot store
+def snapshot_file(folder, field):
+    return os.path.join(folder, field+".npy")
+
+class SnapshotWriter:
+    '''
+    preallocates the snapshot files of all fields on disk and writes
+    snapshot n of each field in place; with restart=True the existing files
+    are opened for update so that a restarted run keeps earlier snapshots
+
+    '''
+    def __init__(self, folder, fields, nsnap, shape, restart=False):
+        os.makedirs(folder, exist_ok=True)
+        mode = 'r+' if restart else 'w+'
+        # plain ints: numpy integers would end up as np.int64(..) in the header
+        shape = (int(nsnap),) + tuple(int(n) for n in shape)
+
+        self.data = {}
+        for field in fields:
+            filename = snapshot_file(folder, field)
+            if restart:
+                self.data[field] = open_memmap(filename, mode=mode)
+                if self.data[field].shape != shape:
+                    raise ValueError("snapshot file "+filename+" has shape "+str(self.data[field].shape))
+            else:
+                self.data[field] = open_memmap(filename, mode=mode, dtype='float64',
+                                               shape=shape)
+
+    def write(self, n, **fields):
+        for field, u in fields.items():
+            self.data[field][n] = u
+
+    def flush(self):
+        for data in self.data.values():
+            data.flush()
+
+    def close(self):
+        self.flush()
+        self.data = {}
+
+def read_snapshots(folder, field, mmap_mode='r'):
+    return np.load(snapshot_file(folder, field), mmap_mode=mmap_mode)
+
+class AsyncSnapshotWriter:
+    '''
+    writes snapshots in a background thread; at most maxsize snapshots are
+    queued (write blocks when the queue is full), which bounds the memory
+    held by pending copies
+
+    '''
+    def __init__(self, writer, maxsize=4):
+        self.writer = writer
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                n, fields = item
+                if self.error is None:
+                    self.writer.write(n, **fields)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+    def write(self, n, **fields):
+        self._check()
+        # copy, the solver keeps updating its arrays in place
+        fields = {field: np.array(u, copy=True) for field, u in fields.items()}
+        self.queue.put((n, fields))
+
+    # wait until all queued snapshots are on disk
+    def flush(self):
+        self.queue.join()
+        self._check()
+        self.writer.flush()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self._check()
+        self.writer.close()
+
+#%%
+# snapshot matrices for POD
+class ObservedSnapshots:
+    '''
+    uo[p] returns the observed snapshot matrix (nx*ny, ns+1) of parameter p,
+    uo = um + noise*um, where um are the physical points (1:nx+1,1:ny+1) of
+    the stored snapshots; only one snapshot of um is in memory at a time
+
+    '''
+    def __init__(self, folders, nx, ny, ns, noise, field='w'):
+        self.folders = list(folders)
+        self.nx = nx
+        self.ny = ny
+        self.ns = ns
+        self.noise = noise
+        self.field = field
+
+    def __len__(self):
+        return len(self.folders)
+
+    def __getitem__(self, p):
+        nx, ny, ns = self.nx, self.ny, self.ns
+        wsnap = read_snapshots(self.folders[p], self.field)
+
+        uo = np.empty(((nx)*(ny), ns+1))
+        for n in range(ns+1):
+            um = np.reshape(wsnap[n,1:nx+1,1:ny+1],(nx)*(ny)) #snapshots from unperturbed solution
+            uo[:,n] = um + self.noise*um #snapshots from observed solution
+        return uo
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Cache helpers shared by the ROM routines (Galerkin operator cache, Grassmann
+charts) and the FDM checkpoints
+
+atomic_savez writes an .npz file through a temporary file and os.replace, so
+an interrupted run never leaves a broken file behind. array_key is a SHA-1
+hash of array contents and shapes plus scalar parameters, used to key cached
+results on the data they were computed from.
+
+"""
+import os
+import hashlib
+import numpy as np
+
+def atomic_savez(filename, **arrays):
+    folder = os.path.dirname(filename)
+    if folder != '':
+        os.makedirs(folder, exist_ok=True)
+
+    tmpfile = filename + ".tmp"
+    with open(tmpfile, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmpfile, filename)
+
+def array_key(arrays, *params):
+    arrays = [np.ascontiguousarray(a, dtype=np.float64) for a in arrays]
+    h = hashlib.sha1()
+    h.update(str(tuple(a.shape for a in arrays) + params).encode())
+    for a in arrays:
+        h.update(a.tobytes())
+    return h.hexdigest()
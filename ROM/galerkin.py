@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Galerkin projection routines shared by the Burgers and Navier-Stokes hybrid
+scripts (ROM/Burgers_1D, ROM/Navier_Stokes_2D)
+
+The scripts add the ROM folder (the parent of their own folder) to the path:
+    import os
+    import sys
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+"""
+import numpy as np
+
+###############################################################################
+# Galerkin ROM right hand side
+###############################################################################
+# r[k] = sum_i b_l[i,k]*a[i] + sum_i sum_j b_nl[i,j,k]*a[i]*a[j]
+# evaluated as two matrix-vector products (BLAS) instead of O(nr^3) loops
+def rhs(nr, b_l, b_nl, a): # Right Handside of Galerkin Projection
+    r2 = np.dot(a, b_l)
+    r3 = np.dot(a, np.dot(a, np.reshape(b_nl, (nr, nr*nr))).reshape(nr, nr))
+
+    r = r2 + r3
+    return r
+
+###############################################################################
+# Batched ROM integration
+###############################################################################
+# rhs for a batch of states a[b,:] (parameters and/or ensembles of initial
+# conditions); b_l is (nr,nr) or (nb,nr,nr), b_nl is (nr,nr,nr) or (nb,nr,nr,nr)
+def rhs_batch(b_l, b_nl, a):
+    nb, nr = a.shape
+    ar = a[:,np.newaxis,:]
+
+    r2 = np.matmul(ar, b_l)
+    temp = np.matmul(ar, np.reshape(b_nl, b_nl.shape[:-3]+(nr, nr*nr)))
+    r3 = np.matmul(ar, np.reshape(temp, (nb, nr, nr)))
+
+    r = r2[:,0,:] + r3[:,0,:]
+    return r
+
+# third-order Adams-Bashforth scheme for a batch of ROMs
+# a0[b,0:3,:] are the first three states of each member
+# with atrue given (modified GP), the rhs is evaluated on the true
+# coefficients: a[k] = atrue[k-1] + dt*(23/12 r(atrue[k-1]) - ...)
+# returns a[b,0:ns+1,:]
+def ab3_batch(b_l, b_nl, a0, dt, ns, atrue=None):
+    nb, _, nr = a0.shape
+    b_l = np.ascontiguousarray(b_l)
+    b_nl = np.ascontiguousarray(b_nl)
+
+    a = np.zeros((nb,ns+1,nr))
+    a[:,:3,:] = a0[:,:3,:]
+
+    if atrue is not None:
+        r = np.zeros((nb,ns,nr))
+        for k in range(ns):
+            r[:,k,:] = rhs_batch(b_l, b_nl, atrue[:,k,:])
+        for k in range(3,ns+1):
+            temp = (23/12) * r[:,k-1,:] - (16/12) * r[:,k-2,:] + (5/12) * r[:,k-3,:]
+            a[:,k,:] = atrue[:,k-1,:] + dt*temp
+        return a
+
+    # rhs of the last three states, each state is evaluated only once
+    r3 = rhs_batch(b_l, b_nl, a[:,0,:])
+    r2 = rhs_batch(b_l, b_nl, a[:,1,:])
+    r1 = rhs_batch(b_l, b_nl, a[:,2,:])
+    for k in range(3,ns+1):
+        temp = (23/12) * r1 - (16/12) * r2 + (5/12) * r3
+        a[:,k,:] = a[:,k-1,:] + dt*temp
+        r3, r2 = r2, r1
+        r1 = rhs_batch(b_l, b_nl, a[:,k,:])
+    return a
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Grassmann manifold interpolation of POD bases shared by the Burgers and
+Navier-Stokes hybrid scripts
+
+The bases Phi[:,:,i] (nx, nr) of the training parameters are mapped to the
+tangent space at the reference basis Phi0 = Phi[:,:,pref] (logarithmic map),
+interpolated there and mapped back (exponential map). The projector
+(I - Phi0 Phi0^T) is never formed: (I - Phi0 Phi0^T) X = X - Phi0 (Phi0^T X),
+so memory is O(nx*nr) and cost O(nx*nr^2) instead of an nx*nx matrix.
+
+The tangent vectors Gamma_i only depend on the training bases and pref.
+GrassmannInterpolator computes them once (fit, optionally cached in a .npz
+file keyed by a hash of the bases) and query(pTest) only does the weighted
+sum, one thin SVD and the exponential map. query also takes an array of
+test parameters: the weights are then one (nq, nc) matrix and the bases
+come from batched SVDs of the (nq, nx, nr) stack of tangent vectors.
+
+Besides the global Lagrange interpolation (unstable for many training
+parameters), local interpolants are available: piecewise linear, cubic
+spline and cubic RBF, on a stencil of the k nearest training parameters,
+so the cost of a query does not grow with the training set.
+
+MultiChartGrassmann keeps several local charts and serves each query from a
+chart of the training parameters around it, with the reference basis at the
+nearest one, instead of one global chart at a fixed reference.
+
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from numpy import linalg as LA
+from scipy.interpolate import CubicSpline
+from cache_io import atomic_savez, array_key
+
+#%%
+# logarithmic map of Phi at Phi0: Gamma = U arctan(S) Vh, where
+# U S Vh = (I - Phi0 Phi0^T) Phi (Phi0^T Phi)^-1, in factored form
+def grassmann_log(Phi0, Phi):
+    templ = Phi - Phi0.dot(Phi0.T.dot(Phi))
+    temp = LA.solve( Phi0.T.dot(Phi).T, templ.T ).T
+
+    U, S, Vh = LA.svd(temp, full_matrices=False)
+    Gamma = LA.multi_dot([U,np.diag(np.arctan(S)),Vh])
+    return Gamma
+
+# exponential map of the tangent vector Gamma at Phi0; Gamma may be a stack
+# (nq, nx, nr), all thin SVDs are then done in one batched LAPACK call
+def grassmann_exp(Phi0, Gamma):
+    U, S, Vh = LA.svd(Gamma, full_matrices=False)
+    V = np.swapaxes(Vh, -1, -2)
+    PhiL = np.matmul(Phi0, V*np.cos(S)[...,np.newaxis,:]) + \
+           U*np.sin(S)[...,np.newaxis,:]
+    PhiL = np.matmul(PhiL, Vh)
+    return PhiL
+
+# Lagrange interpolation weights of the training parameters p at pTest;
+# alpha[i] = prod_{j!=i} (pTest-p[j])/(p[i]-p[j]), shape (nc,) for a scalar
+# pTest and (nq, nc) for an array of nq test parameters
+def lagrange_weights(p, pTest):
+    p = np.asarray(p, dtype=np.float64)
+    pq = np.atleast_1d(np.asarray(pTest, dtype=np.float64))
+    nc = p.size
+
+    offdiag = ~np.eye(nc, dtype=bool)
+    num = np.where(offdiag, (pq[:,np.newaxis] - p)[:,np.newaxis,:], 1.0)
+    den = np.where(offdiag, p[:,np.newaxis] - p, 1.0)
+    alpha = np.prod(num, axis=2)/np.prod(den, axis=1)
+
+    if np.ndim(pTest) == 0:
+        return alpha[0]
+    return alpha
+
+#%%
+# local interpolants in the tangent space: every query only uses a stencil
+# of k training parameters, returned as indices idx (nq, k) into p and
+# weights w (nq, k), GammaL = sum_m w[:,m] Gamma[idx[:,m]]
+
+# the k training parameters nearest to each query (nq, k)
+def nearest(p, pq, k):
+    k = min(k, p.size)
+    d = np.abs(pq[:,np.newaxis] - p)
+    idx = np.argsort(d, axis=1, kind='stable')[:,:k]
+    return np.sort(idx, axis=1)
+
+# k training parameters around each query (nq, k): the two bracketing ones
+# first (searchsorted on the sorted parameters), then the window is grown by
+# distance; unlike nearest, it brackets every query inside the training range
+# also for unevenly spaced parameters
+def stencil(p, pq, k):
+    n = p.size
+    k = min(k, n)
+    order = np.argsort(p, kind='stable')
+    ps = p[order]
+    idx = np.empty((pq.size,k), dtype=int)
+    for q in range(pq.size):
+        hi = int(np.searchsorted(ps, pq[q]))
+        lo = hi - 1
+        if 0 < hi < n and k >= 2:
+            lo, hi = lo - 1, hi + 1
+        while hi - lo - 1 < k:
+            if hi >= n or (lo >= 0 and pq[q] - ps[lo] <= ps[hi] - pq[q]):
+                lo -= 1
+            else:
+                hi += 1
+        idx[q] = order[lo+1:hi]
+    return np.sort(idx, axis=1)
+
+# piecewise linear between the two bracketing training parameters
+# (linear extrapolation from the end intervals)
+def linear_weights(p, pq):
+    order = np.argsort(p)
+    ps = p[order]
+    j = np.clip(np.searchsorted(ps, pq) - 1, 0, p.size-2)
+    t = (pq - ps[j])/(ps[j+1] - ps[j])
+
+    idx = np.stack((order[j], order[j+1]), axis=1)
+    w = np.stack((1.0-t, t), axis=1)
+    return idx, w
+
+# cubic spline (not-a-knot) through the k nearest training parameters; the
+# spline is linear in the data, so its weights are the spline of unit data
+# (with k <= 4 the not-a-knot spline is just the cubic through the stencil)
+def spline_weights(p, pq, k=6):
+    idx = nearest(p, pq, k)
+    w = np.zeros(idx.shape)
+    for q in range(pq.size):
+        ps = p[idx[q]]
+        order = np.argsort(ps)
+        cs = CubicSpline(ps[order], np.eye(ps.size))
+        w[q,order] = cs(pq[q])
+    return idx, w
+
+# RBF with the cubic kernel |r|^3 and a linear polynomial term on the k
+# nearest training parameters (distances scaled by the stencil width)
+def rbf_weights(p, pq, k=4):
+    idx = nearest(p, pq, k)
+    m = idx.shape[1]
+    w = np.zeros(idx.shape)
+    for q in range(pq.size):
+        ps = p[idx[q]]
+        h = np.ptp(ps)
+        if h == 0.0:
+            h = 1.0
+        x = (ps - ps.mean())/h
+        xq = (pq[q] - ps.mean())/h
+
+        A = np.zeros((m+2,m+2))
+        A[:m,:m] = np.abs(x[:,np.newaxis] - x)**3
+        A[:m,m] = 1.0
+        A[:m,m+1] = x
+        A[m,:m] = 1.0
+        A[m+1,:m] = x
+        b = np.concatenate((np.abs(xq - x)**3, [1.0, xq]))
+        w[q] = LA.lstsq(A, b, rcond=None)[0][:m]
+    return idx, w
+
+# k=None takes the default stencil size of the method
+def interpolation_weights(p, pq, method='lagrange', k=None):
+    kw = {} if k is None else {'k': k}
+    if method == 'lagrange':
+        idx = np.tile(np.arange(p.size), (pq.size,1))
+        return idx, lagrange_weights(p, pq)
+    elif method == 'linear':
+        return linear_weights(p, pq)
+    elif method == 'spline':
+        return spline_weights(p, pq, **kw)
+    elif method == 'rbf':
+        return rbf_weights(p, pq, **kw)
+    raise ValueError("unknown interpolation method "+str(method))
+
+#%%
+class GrassmannInterpolator:
+    '''
+    fit: Gamma[:,:,i] of every training basis Phi[:,:,i] at the reference
+    basis Phi[:,:,pref], computed once; with cache_file set, the Gammas are
+    loaded from / saved to that .npz file (recomputed if the file belongs to
+    other bases); query(pTest) returns the interpolated basis (nx, nr)
+
+    method selects the interpolant in the tangent space: 'lagrange' (global,
+    all training parameters), or the local 'linear', 'spline' and 'rbf' that
+    only use the k nearest training parameters (k=None: 6 for 'spline', 4
+    for 'rbf'); it can also be given per query
+
+    '''
+    def __init__(self, Phi, pref, p, cache_file=None, method='lagrange', k=None):
+        self.pref = pref
+        self.p = np.array(p, dtype=np.float64)
+        self.method = method
+        self.k = k
+        self.Phi0 = np.array(Phi[:,:,pref])
+        self.key = self._key(Phi, pref)
+
+        if cache_file is not None and os.path.exists(cache_file):
+            with np.load(cache_file) as data:
+                if str(data['key']) == self.key:
+                    self.Gamma = data['Gamma']
+                    return
+
+        self.fit(Phi)
+        if cache_file is not None:
+            self.save(cache_file)
+
+    @staticmethod
+    def _key(Phi, pref):
+        return array_key([Phi], int(pref))
+
+    def fit(self, Phi):
+        nx,nr,nc = Phi.shape
+        print('Calculating Gammas...')
+        self.Gamma = np.zeros((nx,nr,nc))
+        for i in range(nc):
+            self.Gamma[:,:,i] = grassmann_log(self.Phi0, Phi[:,:,i])
+
+    def save(self, filename):
+        atomic_savez(filename, Gamma=self.Gamma, key=self.key)
+
+    # interpolated tangent vectors (nq, nx, nr) from the stencils idx, w;
+    # one tensordot if every stencil is the full training set (lagrange)
+    def tangent(self, idx, w):
+        nx,nr,nc = self.Gamma.shape
+        if idx.shape[1] == nc and np.all(idx == np.arange(nc)):
+            return np.tensordot(w, self.Gamma, axes=([1],[2]))
+        GammaL = np.zeros((idx.shape[0],nx,nr))
+        for m in range(idx.shape[1]):
+            GammaL += w[:,m,np.newaxis,np.newaxis]*np.moveaxis(self.Gamma[:,:,idx[:,m]],-1,0)
+        return GammaL
+
+    # pTest scalar: basis (nx, nr); pTest array (nq,): stack of bases
+    # (nq, nx, nr), evaluated chunk queries at a time, chunks in parallel
+    # on threads (LAPACK releases the GIL)
+    def query(self, pTest, method=None, k=None, chunk=64, threads=1):
+        if method is None:
+            method = self.method
+        if k is None:
+            k = self.k
+        pq = np.atleast_1d(np.asarray(pTest, dtype=np.float64))
+        idx, w = interpolation_weights(self.p, pq, method, k)
+
+        nx,nr,nc = self.Gamma.shape
+        PhiL = np.empty((pq.size,nx,nr))
+
+        def interpolate(q):
+            GammaL = self.tangent(idx[q:q+chunk], w[q:q+chunk])
+            PhiL[q:q+chunk] = grassmann_exp(self.Phi0, GammaL)
+
+        starts = range(0, pq.size, chunk)
+        if threads > 1:
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(interpolate, starts))
+        else:
+            for q in starts:
+                interpolate(q)
+
+        if np.ndim(pTest) == 0:
+            return PhiL[0]
+        return PhiL
+
+# Grassmann Interpolation
+def GrassInt(Phi,pref,p,pTest):
+    # Phi is input basis [training]
+    # pref is the reference basis [arbitrarty] for Grassmann interpolation
+    # p is the set of training parameters
+    # pTest is the testing parameter
+    return GrassmannInterpolator(Phi,pref,p).query(pTest)
+
+#%%
+class MultiChartGrassmann:
+    '''
+    Grassmann interpolation on several local charts: a chart contains size
+    training parameters around the test parameter (the bracketing pair,
+    then the nearest others, see stencil; so inside the training range it
+    is interpolated, not extrapolated, for any spacing of the parameters)
+    and has its reference basis at the training parameter nearest to the
+    test parameter, so the reference is selected automatically and
+    (Phi0^T Phi_i) stays well conditioned
+
+    refs are the indices of the training parameters that may be chart
+    references (default: all); charts are fitted on first use and kept
+    (with cache_dir set, their Gammas are also stored on disk)
+
+    '''
+    def __init__(self, Phi, p, refs=None, size=4, method='lagrange', k=None,
+                 cache_dir=None):
+        self.Phi = Phi
+        self.p = np.array(p, dtype=np.float64)
+        if refs is None:
+            refs = range(self.p.size)
+        self.refs = np.array(refs, dtype=int)
+        self.size = min(size, self.p.size)
+        self.method = method
+        self.k = k
+        self.cache_dir = cache_dir
+        self.charts = {}
+
+    # index of the chart reference nearest to each test parameter
+    def reference(self, pTest):
+        pq = np.atleast_1d(np.asarray(pTest, dtype=np.float64))
+        d = np.abs(pq[:,np.newaxis] - self.p[self.refs])
+        ref = self.refs[np.argmin(d, axis=1)]
+        if np.ndim(pTest) == 0:
+            return ref[0]
+        return ref
+
+    # chart members (training parameter indices) of each test parameter,
+    # (nq, size), or (nq, size+1) rows padded with -1 when a reference
+    # outside the stencil (refs given) has to be added
+    def members(self, pTest):
+        pq = np.atleast_1d(np.asarray(pTest, dtype=np.float64))
+        idx = stencil(self.p, pq, self.size)
+        ref = self.reference(pq)
+        missing = ~np.any(idx == ref[:,np.newaxis], axis=1)
+        if np.any(missing):
+            idx = np.hstack((idx, np.where(missing, ref, -1)[:,np.newaxis]))
+        return idx
+
+    def chart(self, ref, members):
+        ref = int(ref)
+        members = np.unique(np.asarray(members)[np.asarray(members) >= 0])
+        key = (ref,) + tuple(members.tolist())
+        if key not in self.charts:
+            pref = int(np.flatnonzero(members == ref)[0])
+
+            cache_file = None
+            if self.cache_dir is not None:
+                cache_file = os.path.join(self.cache_dir, "grass_chart_"+
+                                          "_".join(str(i) for i in key)+".npz")
+
+            self.charts[key] = GrassmannInterpolator(self.Phi[:,:,members], pref,
+                                                     self.p[members], cache_file,
+                                                     self.method, self.k)
+        return self.charts[key]
+
+    # same outputs as GrassmannInterpolator.query; queries that share
+    # reference and members are served together
+    def query(self, pTest, method=None, k=None, chunk=64, threads=1):
+        ref = self.reference(pTest)
+        members = self.members(pTest)
+        if np.ndim(pTest) == 0:
+            return self.chart(ref, members[0]).query(pTest, method, k)
+
+        pq = np.asarray(pTest, dtype=np.float64)
+        nx,nr,nc = self.Phi.shape
+        PhiL = np.empty((pq.size,nx,nr))
+        keys, inv = np.unique(np.column_stack((ref, members)), axis=0,
+                              return_inverse=True)
+        for c in range(keys.shape[0]):
+            q = np.flatnonzero(inv.ravel() == c)
+            PhiL[q] = self.chart(keys[c,0], keys[c,1:]).query(pq[q], method, k,
+                                                            chunk, threads)
+        return PhiL
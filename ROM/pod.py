@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+POD routines shared by the Burgers and Navier-Stokes hybrid scripts
+
+POD(u, R, method) computes the R leading modes of the snapshot matrix
+u (n, ns) with one of three backends:
+    'svd'        thin SVD of u (exact, reference)
+    'snapshots'  method of snapshots: eigen-decomposition of the small
+                 (ns, ns) Gram matrix u^T u, for n >> ns
+    'randomized' randomized SVD of u with oversampling and power iterations,
+                 only R+oversample singular values are computed
+
+L are the POD eigenvalues (squared singular values, length ns; entries that
+are not computed are zero). RIC is always taken relative to the total energy
+trace(u^T u) = ||u||_F^2, so it is exact for every backend. Phi always has
+R columns; if u has rank below R, the extra columns are orthonormal
+directions with zero energy.
+
+IncrementalPOD builds the POD from a stream of snapshot batches (e.g. from
+the FDM time loop or the snapshot store) without the snapshot matrix.
+
+"""
+import numpy as np
+from numpy import linalg as LA
+
+def POD(u,R,method='svd',oversample=10,n_iter=2,seed=None): #Basis Construction
+    n,ns = u.shape
+    L = np.zeros(ns)
+
+    if method == 'svd':
+        U,S,Vh = LA.svd(u, full_matrices=False)
+        Phi = U[:,:R]
+        L[:S.size] = S**2
+
+    elif method == 'snapshots':
+        C = np.dot(u.T,u)
+        lam,V = LA.eigh(C)
+        lam,V = lam[::-1],V[:,::-1] # descending order
+        lam = np.maximum(lam,0.0)
+        L[:] = lam
+        # modes at round-off level of the Gram matrix (rank of u below R)
+        # are not divided by ~0 but completed with orthonormal directions
+        # outside the span of u (L = 0), so Phi always has R columns
+        k = min(R, np.count_nonzero(lam > ns*np.finfo(float).eps*lam[0]))
+        Phi = np.dot(u,V[:,:k])/np.sqrt(lam[:k])
+        if k < R:
+            X = np.random.RandomState(0).standard_normal((n,R-k))
+            for _ in range(2): # projected twice, orthogonal to round-off
+                X -= np.dot(Phi, np.dot(Phi.T, X))
+            Q,_ = LA.qr(X)
+            Phi = np.hstack((Phi, Q))
+
+    elif method == 'randomized':
+        k = min(R+oversample, n, ns)
+        rng = np.random.RandomState(seed)
+        Q,_ = LA.qr(np.dot(u, rng.standard_normal((ns,k))))
+        for _ in range(n_iter): # power iterations, re-orthonormalized
+            Q,_ = LA.qr(np.dot(u.T,Q))
+            Q,_ = LA.qr(np.dot(u,Q))
+        Ub,S,Vh = LA.svd(np.dot(Q.T,u), full_matrices=False)
+        Phi = np.dot(Q,Ub[:,:R])
+        L[:S.size] = S**2
+
+    else:
+        raise ValueError("unknown POD method "+str(method))
+
+    #compute RIC (relative inportance index)
+    RIC = sum(L[:R])/np.einsum('ij,ij->',u,u)*100
+    return Phi,L,RIC
+
+def PODproj(u,Phi): #Projection
+    a = np.dot(u.T,Phi)  # u = Phi * a.T
+    return a
+
+def PODrec(a,Phi): #Reconstruction
+    u = np.dot(Phi,a.T)
+    return u
+
+class IncrementalPOD:
+    '''
+    streaming POD (Brand's incremental SVD): snapshots are added in batches
+    with update(u), u (n,) or (n, m), and only the truncated basis U (n, k)
+    and the singular values S are kept, never the snapshot matrix; after
+    each update at most R modes are kept, and modes with S < tol*S[0] are
+    dropped; the total energy is accumulated exactly so that RIC stays
+    relative to all snapshots seen
+
+    '''
+    def __init__(self, R, tol=0.0):
+        self.R = R
+        self.tol = tol
+        self.U = None
+        self.S = None
+        self.energy = 0.0
+        self.nsnap = 0
+
+    def _truncate(self, U, S):
+        k = min(self.R, np.count_nonzero(S > self.tol*S[0]))
+        self.U = U[:,:k]
+        self.S = S[:k]
+
+    def update(self, u):
+        u = np.reshape(u, (u.shape[0], -1))
+        self.energy += np.einsum('ij,ij->',u,u)
+        self.nsnap += u.shape[1]
+
+        if self.U is None:
+            U,S,Vh = LA.svd(u, full_matrices=False)
+            self._truncate(U, S)
+            return
+
+        # component of the new snapshots in and orthogonal to the basis
+        # (projected twice to keep U orthonormal over long streams)
+        p = np.dot(self.U.T, u)
+        r = u - np.dot(self.U, p)
+        p2 = np.dot(self.U.T, r)
+        p += p2
+        r -= np.dot(self.U, p2)
+        Q,Rr = LA.qr(r)
+
+        k, m = self.S.size, u.shape[1]
+        K = np.zeros((k+m, k+m))
+        K[:k,:k] = np.diag(self.S)
+        K[:k,k:] = p
+        K[k:,k:] = Rr
+        Uk,S,Vh = LA.svd(K)
+
+        U = np.dot(np.hstack((self.U, Q)), Uk)
+        self._truncate(U, S)
+
+    def basis(self, R=None):
+        # same outputs as POD: Phi, L, RIC
+        if R is None:
+            R = self.R
+        Phi = self.U[:,:R]
+        L = self.S**2
+        RIC = sum(L[:R])/self.energy*100
+        return Phi,L,RIC